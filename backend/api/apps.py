@@ -1,5 +1,17 @@
+import os
+
 from django.apps import AppConfig
+from django.conf import settings
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
 
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        pdfmetrics.registerFont(TTFont(
+            'FreeSans', os.path.join(settings.BASE_DIR, settings.PDF_FONT)
+        ))
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from rest_framework.authentication import TokenAuthentication
+
+from users.models import User
+
+# Поля, которых хватает представлениям и классам из api/permissions.py;
+# остальные поля пользователя загрузятся из базы при первом обращении.
+# Порядок — как у полей модели, этого требует Model.from_db.
+CACHED_USER_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields
+    if field.attname in (
+        'id', 'username', 'email', 'first_name', 'last_name', 'role',
+        'is_staff', 'is_superuser', 'is_active',
+    )
+)
+
+
+def get_cache_key(key):
+    return f'auth-token:{key}'
+
+
+def invalidate_tokens(keys):
+    keys = [get_cache_key(key) for key in keys]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, запоминающая пользователя токена в кэше.
+
+    Пока запись жива, запрос не обращается к authtoken_token и
+    users_user: пользователь собирается из кэша как модель с отложенными
+    полями. Сигналы сбрасывают запись при удалении токена, сохранении
+    пользователя (смена пароля, деактивация) и его удалении.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = get_cache_key(key)
+        values = cache.get(cache_key)
+        if values is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(
+                cache_key,
+                [getattr(user, field) for field in CACHED_USER_FIELDS],
+                settings.AUTH_TOKEN_CACHE_TIMEOUT
+            )
+            return user, token
+        user = User.from_db(
+            router.db_for_read(User), CACHED_USER_FIELDS, values
+        )
+        return user, self.get_model()(key=key, user=user)
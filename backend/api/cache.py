@@ -0,0 +1,123 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+
+from .metrics import histograms
+
+RECIPE_CACHE_TIMEOUT = getattr(settings, 'RECIPE_CACHE_TIMEOUT', 60 * 60)
+RECIPE_CACHE_LOCK_TIMEOUT = 10
+RECIPE_CACHE_WAIT = (0.01, 0.02, 0.04)
+
+GENERATION_KEY = 'recipe-repr:generation'
+
+
+def _versions():
+    """Кэш версий: вытеснение версии равносильно сбросу записей."""
+    return caches['versions']
+
+
+def _version_key(pk):
+    return f'recipe-repr:version:{pk}'
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def _get_keys(ids):
+    """Ключи кэша с текущими версиями рецептов и общим поколением."""
+    version_keys = [_version_key(pk) for pk in ids]
+    versions = _versions().get_many([GENERATION_KEY, *version_keys])
+    for key in (GENERATION_KEY, *version_keys):
+        if key not in versions:
+            _versions().add(key, _new_version(), None)
+            versions[key] = _versions().get(key)
+    generation = versions[GENERATION_KEY]
+    return {
+        pk: f'recipe-repr:{generation}:{pk}:{versions[_version_key(pk)]}'
+        for pk in ids
+    }
+
+
+def _wait_for(keys):
+    found = {}
+    for delay in RECIPE_CACHE_WAIT:
+        time.sleep(delay)
+        found.update(cache.get_many(
+            [key for key in keys if key not in found]
+        ))
+        if len(found) == len(keys):
+            break
+    return found
+
+
+def get_or_build(ids, build):
+    """
+    Возвращает {id: представление} для рецептов ids.
+
+    Отсутствующие в кэше представления строит build(ids). Перестраивает
+    запись только процесс, захвативший блокировку, остальные недолго ждут
+    его результат и лишь потом считают сами, не записывая в кэш.
+    """
+    keys = _get_keys(ids)
+    found = cache.get_many(list(keys.values()))
+    result = {pk: found[key] for pk, key in keys.items() if key in found}
+    missing = [pk for pk in ids if pk not in result]
+    histograms.increment('foodgram_recipe_cache_hits_total', len(result))
+    histograms.increment('foodgram_recipe_cache_misses_total', len(missing))
+    if not missing:
+        return result
+    owned = [
+        pk for pk in missing
+        if cache.add(f'{keys[pk]}:lock', 1, RECIPE_CACHE_LOCK_TIMEOUT)
+    ]
+    waiting = {keys[pk]: pk for pk in missing if pk not in owned}
+    if waiting:
+        for key, data in _wait_for(list(waiting)).items():
+            result[waiting[key]] = data
+    built = build([pk for pk in missing if pk not in result])
+    result.update(built)
+    cache.set_many(
+        {keys[pk]: built[pk] for pk in owned if pk in built},
+        RECIPE_CACHE_TIMEOUT
+    )
+    cache.delete_many([f'{keys[pk]}:lock' for pk in owned])
+    return result
+
+
+def invalidate_recipes(ids):
+    """
+    Сбрасывает записи рецептов после коммита: иначе параллельное чтение
+    успело бы положить старые строки под новую версию.
+    """
+    ids = list(ids)
+    transaction.on_commit(lambda: _versions().set_many(
+        {_version_key(pk): _new_version() for pk in ids}, None
+    ))
+
+
+def invalidate_all():
+    transaction.on_commit(
+        lambda: _versions().set(GENERATION_KEY, _new_version(), None)
+    )
+
+
+def get_model_version(model):
+    """Версия и время последнего изменения таблицы справочника."""
+    key = f'model-version:{model._meta.label_lower}'
+    version = _versions().get(key)
+    if version is None:
+        _versions().add(key, (_new_version(), time.time()), None)
+        version = _versions().get(key)
+    return version
+
+
+def bump_model_version(model):
+    """Меняет версию таблицы после коммита текущей транзакции."""
+    key = f'model-version:{model._meta.label_lower}'
+    transaction.on_commit(
+        lambda: _versions().set(key, (_new_version(), time.time()), None)
+    )
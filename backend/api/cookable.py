@@ -0,0 +1,198 @@
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.core.cache import caches
+from django.db import transaction
+
+from recipes.models import IngredientRecipe
+
+from .cache import bump_model_version, get_model_version
+from .indexes import VersionedIndex
+
+# Журнал изменений состава: запись N — список id рецептов, HEAD_KEY —
+# последний выданный номер. Журнал общий для всех воркеров и лежит в кэше
+# версий; массовые записи вместо него меняют версию IngredientRecipe.
+HEAD_KEY = 'cookable:head'
+LOG_TIMEOUT = 60 * 60 * 24
+LOG_BATCH = 100
+# Сколько секунд ждать запись с уже выданным номером: воркер мог ещё
+# не успеть её положить. Дольше — запись вытеснена.
+LOG_GAP_TIMEOUT = 5
+
+
+def _log_key(seq):
+    return f'cookable:log:{seq}'
+
+
+def append_changes(recipe_ids):
+    """
+    Добавляет запись в журнал. Номер выдаёт атомарный incr, поэтому два
+    воркера не займут один номер.
+    """
+    versions = caches['versions']
+    versions.add(HEAD_KEY, 0, None)
+    try:
+        seq = versions.incr(HEAD_KEY)
+    except ValueError:
+        # Счётчик вытеснен между add и incr: индексы соберутся заново.
+        bump_model_version(IngredientRecipe)
+        return
+    versions.set(_log_key(seq), recipe_ids, LOG_TIMEOUT)
+
+
+def read_changes(after):
+    """
+    Рецепты из идущих подряд записей журнала после номера after и номер
+    последней прочитанной записи.
+    """
+    versions = caches['versions']
+    recipe_ids = set()
+    seq = after
+    while True:
+        keys = [_log_key(n) for n in range(seq + 1, seq + 1 + LOG_BATCH)]
+        found = versions.get_many(keys)
+        for key in keys:
+            if key not in found:
+                break
+            recipe_ids.update(found[key])
+            seq += 1
+        else:
+            continue
+        break
+    return seq, recipe_ids
+
+
+def ingredients_changed(recipe_ids):
+    """После коммита сообщает индексам всех воркеров о новом составе."""
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(lambda: append_changes(recipe_ids))
+
+
+def _contains(recipes, pk):
+    position = bisect_left(recipes, pk)
+    return position < len(recipes) and recipes[position] == pk
+
+
+class RecipeIngredientIndex(VersionedIndex):
+    """
+    Инвертированный индекс «ингредиент → рецепты» в памяти процесса.
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов,
+    для каждого рецепта — число его ингредиентов. Изменённые рецепты
+    воркеры перечитывают по журналу; целиком индекс собирается при старте,
+    при смене версии IngredientRecipe и если журнал вытеснен.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._state = ({}, {})
+        self._seq = 0
+        self._gap = None
+
+    def current_version(self):
+        return (
+            get_model_version(IngredientRecipe)[0],
+            caches['versions'].get(HEAD_KEY, 0),
+        )
+
+    def load(self):
+        # Номер берётся до чтения таблицы: записи журнала после него
+        # перечитаются повторно, это безопасно.
+        seq = caches['versions'].get(HEAD_KEY, 0)
+        postings = {}
+        sizes = Counter()
+        rows = IngredientRecipe.objects.values_list(
+            'ingredient_id', 'recipe_id'
+        ).order_by('ingredient_id', 'recipe_id').iterator()
+        for ingredient_id, recipe_id in rows:
+            if ingredient_id not in postings:
+                postings[ingredient_id] = array('I')
+            postings[ingredient_id].append(recipe_id)
+            sizes[recipe_id] += 1
+        self._state = (postings, dict(sizes))
+        self._seq = seq
+        self._gap = None
+
+    def update(self, version):
+        generation, head = version
+        if generation != self._version[0] or head < self._seq:
+            # Сменилась версия таблицы или журнал начат заново.
+            self.load()
+            return generation, self._seq
+        seq, recipe_ids = read_changes(self._seq)
+        if recipe_ids:
+            self.apply(recipe_ids)
+        self._seq = seq
+        # Пропущенная запись: ждём её LOG_GAP_TIMEOUT, а до тех пор
+        # возвращаем неполную версию, чтобы refresh() прочитал журнал снова.
+        if seq >= head:
+            self._gap = None
+        elif self._gap is None or self._gap[0] != seq:
+            self._gap = (seq, time.monotonic())
+        elif time.monotonic() - self._gap[1] > LOG_GAP_TIMEOUT:
+            self.load()
+        return generation, self._seq
+
+    def apply(self, recipe_ids):
+        """
+        Перечитывает состав рецептов recipe_ids. Изменённые массивы
+        заменяются копиями: поиск в других потоках дочитывает прежние.
+        """
+        current = defaultdict(set)
+        counts = Counter()
+        for ingredient_id, recipe_id in IngredientRecipe.objects.filter(
+                recipe_id__in=recipe_ids).values_list(
+                'ingredient_id', 'recipe_id'):
+            current[ingredient_id].add(recipe_id)
+            counts[recipe_id] += 1
+        old_postings, sizes = self._state
+        postings = dict(old_postings)
+        for pk, count in counts.items():
+            sizes[pk] = count
+        for ingredient_id, recipes in old_postings.items():
+            if ingredient_id not in current and not any(
+                    _contains(recipes, pk) for pk in recipe_ids):
+                continue
+            kept = {pk for pk in recipes if pk not in recipe_ids}
+            kept.update(current.pop(ingredient_id, ()))
+            if kept:
+                postings[ingredient_id] = array('I', sorted(kept))
+            else:
+                del postings[ingredient_id]
+        for ingredient_id, added in current.items():
+            postings[ingredient_id] = array('I', sorted(added))
+        self._state = (postings, sizes)
+        for pk in recipe_ids:
+            if pk not in counts:
+                sizes.pop(pk, None)
+
+    def search(self, ingredient_ids, limit):
+        """
+        Рецепты, где есть хотя бы один из ingredient_ids.
+
+        Возвращает [(id, совпало, не хватает)]: сначала рецепты с большим
+        числом совпавших ингредиентов, затем с меньшим числом недостающих.
+        """
+        self.refresh()
+        postings, sizes = self._state
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(postings.get(ingredient_id, ()))
+        # Рецепт могли удалить из индекса во время поиска.
+        missing = {
+            recipe_id: sizes.get(recipe_id, count) - count
+            for recipe_id, count in matched.items()
+        }
+        ranked = sorted(
+            matched.items(),
+            key=lambda item: (-item[1], missing[item[0]], -item[0])
+        )[:limit]
+        return [
+            (recipe_id, count, missing[recipe_id])
+            for recipe_id, count in ranked
+        ]
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
@@ -0,0 +1,39 @@
+import csv
+import json
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def text_lines(rows):
+    for number, row in enumerate(rows, start=1):
+        yield (
+            f'{number}. {row["ingredient__name"]} '
+            f'({row["ingredient__measurement_unit"]}) — '
+            f'{row["ingredient_total"]}\n'
+        )
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in rows:
+        yield writer.writerow((
+            row['ingredient__name'],
+            row['ingredient__measurement_unit'],
+            row['ingredient_total'],
+        ))
+
+
+def json_lines(rows):
+    separator = '[\n'
+    for row in rows:
+        yield separator + json.dumps({
+            'name': row['ingredient__name'],
+            'measurement_unit': row['ingredient__measurement_unit'],
+            'amount': row['ingredient_total'],
+        }, ensure_ascii=False)
+        separator = ',\n'
+    yield '[]' if separator == '[\n' else '\n]'
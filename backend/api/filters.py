@@ -1,13 +1,40 @@
+from django.db.models import Count, Exists, OuterRef, Subquery
 from rest_framework import filters
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import SearchFilter
 
+from recipes.models import Recipe, Tag
+
+from .pagination import RecipePagination
+from .search import search
+
 
 class TagFilter(filters.BaseFilterBackend):
+    """
+    Рецепты с любым из тегов (?tags_mode=any, по умолчанию) или со всеми
+    тегами сразу (?tags_mode=all).
+
+    Проверка идёт подзапросом по таблице связей, без JOIN и DISTINCT.
+    """
+
     def filter_queryset(self, request, queryset, view):
-        tags = request.query_params.getlist('tags')
-        if tags:
-            return queryset.filter(tags__slug__in=tags).distinct()
-        return queryset
+        tags = set(request.query_params.getlist('tags'))
+        if not tags:
+            return queryset
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'),
+            tag__in=Tag.objects.filter(slug__in=tags)
+        )
+        if request.query_params.get('tags_mode') == 'all':
+            matched = recipe_tags.order_by().values('recipe').annotate(
+                total=Count('pk')
+            ).values('total')
+            return queryset.annotate(
+                tags_matched=Subquery(matched)
+            ).filter(tags_matched=len(tags))
+        return queryset.annotate(
+            has_tags=Exists(recipe_tags)
+        ).filter(has_tags=True)
 
 
 class AuthorFilter(filters.BaseFilterBackend):
@@ -39,5 +66,27 @@ class ShoppingCartFilter(filters.BaseFilterBackend):
             return queryset.filter(cart__user=user)
         return None
 
+
+class RecipeSearchFilter(filters.BaseFilterBackend):
+    """
+    Полнотекстовый поиск по релевантности.
+
+    Курсор держит порядок по дате, а не по релевантности, поэтому с
+    ?cursor= поиск не сочетается: выдача идёт постранично.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if query:
+            if RecipePagination.cursor_query_param in request.query_params:
+                raise ValidationError({
+                    self.search_param:
+                        'Поиск не поддерживает курсор, используйте page.'
+                })
+            return search(queryset, query)
+        return queryset
+
+
 class IngredientSearchFilter(SearchFilter):
     search_param = 'name'
@@ -0,0 +1,134 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+
+from . import cache
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'recipes/renditions'
+PIL_FORMATS = {'avif': 'AVIF', 'jpeg': 'JPEG', 'webp': 'WEBP'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_formats():
+    """Форматы из настроек, которые умеет сохранять установленный Pillow."""
+    Image.init()
+    return [
+        name for name in settings.RECIPE_IMAGE_FORMATS
+        if PIL_FORMATS.get(name) in Image.SAVE
+    ]
+
+
+def rendition_name(image_name, rendition, image_format):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{RENDITIONS_DIR}/{stem}/{rendition}.{image_format}'
+
+
+def get_renditions(recipe):
+    """{копия: {формат: путь}} или None, пока копии не готовы."""
+    name = recipe.image.name if recipe.image else ''
+    if not name or recipe.renditions_image != name:
+        return None
+    formats = get_formats()
+    return {
+        rendition: {
+            image_format: rendition_name(name, rendition, image_format)
+            for image_format in formats
+        }
+        for rendition in settings.RECIPE_IMAGE_RENDITIONS
+    }
+
+
+def open_image(image_name):
+    with default_storage.open(image_name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            return background
+        return image.convert('RGB')
+
+
+def render(image_name):
+    """
+    Сохраняет уменьшенные копии фотографии во всех форматах.
+
+    Исходник декодируется один раз, каждая следующая копия получается
+    уменьшением предыдущей, от большей к меньшей.
+    """
+    image = open_image(image_name)
+    renditions = sorted(
+        settings.RECIPE_IMAGE_RENDITIONS.items(), key=lambda item: -item[1]
+    )
+    for rendition, size in renditions:
+        image.thumbnail((size, size), Image.LANCZOS)
+        for image_format in get_formats():
+            buffer = BytesIO()
+            image.save(
+                buffer, PIL_FORMATS[image_format],
+                quality=settings.RECIPE_IMAGE_QUALITY
+            )
+            path = rendition_name(image_name, rendition, image_format)
+            default_storage.delete(path)
+            default_storage.save(path, ContentFile(buffer.getvalue()))
+
+
+def process(pk, image_name):
+    """Готовит копии и отмечает рецепт, если фото за это время не сменили."""
+    try:
+        render(image_name)
+    except Exception:
+        logger.exception('Не удалось обработать фото рецепта %s', pk)
+        return
+    updated = Recipe.objects.filter(pk=pk, image=image_name).update(
+        renditions_image=image_name
+    )
+    if updated:
+        cache.invalidate_recipes([pk])
+
+
+def _process_in_worker(pk, image_name):
+    try:
+        process(pk, image_name)
+    finally:
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images'
+            )
+    return _executor
+
+
+def submit(pk, image_name):
+    if not settings.RECIPE_IMAGE_WORKERS:
+        process(pk, image_name)
+        return
+    get_executor().submit(_process_in_worker, pk, image_name)
+
+
+def schedule(recipe):
+    """Ставит обработку нового фото рецепта в очередь после коммита."""
+    name = recipe.image.name if recipe.image else ''
+    if not name or recipe.renditions_image == name:
+        return
+    transaction.on_commit(lambda: submit(recipe.pk, name))
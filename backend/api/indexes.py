@@ -0,0 +1,70 @@
+import threading
+import time
+
+from .replicas import read_from_primary
+
+
+class VersionedIndex:
+    """
+    Индекс в памяти процесса, который следует за версией в общем кэше.
+
+    Раз в refresh_interval секунд refresh() сравнивает current_version()
+    со своей версией и при расхождении вызывает update(). Обновляет индекс
+    один поток, остальные тем временем читают прежнее состояние; ждут
+    только первой сборки. Подклассы подменяют состояние одним
+    присваиванием, чтобы читатели не видели его наполовину обновлённым.
+    """
+    refresh_interval = 1.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0
+
+    def current_version(self):
+        raise NotImplementedError
+
+    def load(self):
+        """Собирает индекс из базы целиком."""
+        raise NotImplementedError
+
+    def update(self, version):
+        """
+        Приводит индекс к версии version; по умолчанию — пересборкой.
+        Возвращает версию, до которой индекс удалось довести.
+        """
+        self.load()
+        return version
+
+    @read_from_primary()
+    def build(self, version=None):
+        """Полная сборка: при старте процесса и для восстановления."""
+        with self._lock:
+            if version is None:
+                version = self.current_version()
+            self.load()
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    @read_from_primary()
+    def refresh(self):
+        if (self._version is not None
+                and time.monotonic() - self._checked_at
+                < self.refresh_interval):
+            return
+        if not self._lock.acquire(blocking=self._version is None):
+            return
+        try:
+            if (self._version is not None
+                    and time.monotonic() - self._checked_at
+                    < self.refresh_interval):
+                return
+            version = self.current_version()
+            if self._version is None:
+                self.load()
+            elif version != self._version:
+                version = self.update(version)
+            self._version = version
+            self._checked_at = time.monotonic()
+        finally:
+            self._lock.release()
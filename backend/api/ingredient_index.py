@@ -0,0 +1,67 @@
+from bisect import bisect_left
+
+from django.conf import settings
+
+from recipes.models import Ingredient
+
+from .cache import get_model_version
+from .indexes import VersionedIndex
+
+MAX_CHAR = chr(0x10FFFF)
+
+
+def fold(name):
+    """Приводит название к виду для сравнения: регистр, ё/е, пробелы."""
+    return ' '.join(name.casefold().replace('ё', 'е').split())
+
+
+class IngredientIndex(VersionedIndex):
+    """
+    Отсортированный индекс названий ингредиентов в памяти процесса.
+
+    Индекс перестраивается, когда меняется версия Ingredient в общем кэше,
+    так что изменения таблицы видят все воркеры, а не только тот, где они
+    сделаны.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._state = ([], [])
+
+    def current_version(self):
+        version, _ = get_model_version(Ingredient)
+        return version
+
+    def load(self):
+        rows = Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit'
+        ).iterator()
+        entries = sorted((fold(name), pk, name, unit)
+                         for pk, name, unit in rows)
+        self._state = (
+            [entry[0] for entry in entries],
+            [
+                {'id': pk, 'name': name, 'measurement_unit': unit}
+                for _, pk, name, unit in entries
+            ],
+        )
+
+    def search(self, prefix, limit=None):
+        """
+        Ингредиенты, название которых начинается с prefix.
+
+        Точное совпадение сортируется первым, остальные идут по алфавиту.
+        """
+        if limit is None:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        self.refresh()
+        keys, items = self._state
+        prefix = fold(prefix)
+        start = bisect_left(keys, prefix)
+        end = bisect_left(
+            keys, prefix + MAX_CHAR, start, min(start + limit, len(keys))
+        )
+        return items[start:end]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,52 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from api.views import RecipeViewSet
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время и пиковую память генерации PDF списка покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lines', type=int, nargs='+', default=[10, 100, 1000],
+            help='Количество строк в списке покупок.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Сколько раз повторить каждый замер.'
+        )
+
+    def render(self, shopping_list):
+        response = RecipeViewSet.canvas_method(shopping_list)
+        size = sum(len(chunk) for chunk in response.streaming_content)
+        response.close()
+        return size
+
+    def handle(self, *args, **options):
+        self.stdout.write('lines\tms(median)\tpeak KiB\tsize KiB')
+        for lines in options['lines']:
+            shopping_list = [
+                {
+                    'ingredient__name': f'Ингредиент {number}',
+                    'ingredient__measurement_unit': 'г',
+                    'ingredient_total': number,
+                }
+                for number in range(lines)
+            ]
+            timings = []
+            peak = 0
+            for _ in range(options['repeat']):
+                tracemalloc.start()
+                started = time.perf_counter()
+                size = self.render(shopping_list)
+                timings.append(time.perf_counter() - started)
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            timings.sort()
+            self.stdout.write(
+                f'{lines}\t{timings[len(timings) // 2] * 1000:.1f}\t'
+                f'{peak / 1024:.0f}\t{size / 1024:.0f}'
+            )
@@ -0,0 +1,179 @@
+import json
+import math
+import time
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.middleware import QueryTimer
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import User
+
+
+def percentile(values, share):
+    """Значение по методу ближайшего ранга."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(share * len(ordered)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет p50/p95 времени ответа и число SQL-запросов основных '
+        'эндпоинтов API и сравнивает их с сохранённым результатом.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int,
+            help='id пользователя, от имени которого идут запросы.'
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--warmup', type=int, default=2,
+            help='Сколько запросов не учитывать, пока прогреваются кэши.'
+        )
+        parser.add_argument(
+            '--only', nargs='*',
+            help='Замерить только сценарии, в названии которых есть строка.'
+        )
+        parser.add_argument(
+            '--output', help='Сохранить результат в JSON-файл.'
+        )
+        parser.add_argument(
+            '--baseline', help='JSON-файл с прошлым результатом.'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=20.0,
+            help='Допустимый рост p95 в процентах при сравнении.'
+        )
+
+    def get_scenarios(self):
+        recipe = Recipe.objects.order_by('-favorites_count').first()
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        ingredients = list(IngredientRecipe.objects.filter(
+            recipe=recipe
+        ).values_list('ingredient_id', flat=True)) if recipe else []
+        word = recipe.name.split()[0] if recipe else 'суп'
+        ingredient = Ingredient.objects.first()
+        prefix = ingredient.name[:3] if ingredient else 'мол'
+        return {
+            'recipes: list': ('/api/recipes/', {}),
+            'recipes: list, page 10': ('/api/recipes/', {'page': 10}),
+            'recipes: cursor': ('/api/recipes/', {'cursor': ''}),
+            'recipes: tags': ('/api/recipes/', {'tags': tags}),
+            'recipes: favorites': ('/api/recipes/', {'is_favorited': 1}),
+            'recipes: search': ('/api/recipes/', {'search': word}),
+            'recipes: detail': (
+                f'/api/recipes/{recipe.id if recipe else 0}/', {}
+            ),
+            'recipes: cookable': (
+                '/api/recipes/cookable/', {'ingredients': ingredients}
+            ),
+            'subscriptions: list': (
+                '/api/users/subscriptions/', {'recipes_limit': 3}
+            ),
+            'users: list': ('/api/users/', {}),
+            'ingredients: search': ('/api/ingredients/', {'name': prefix}),
+            'shopping cart: pdf': (
+                '/api/recipes/download_shopping_cart/', {}
+            ),
+            'shopping cart: csv': (
+                '/api/recipes/download_shopping_cart/', {'format': 'csv'}
+            ),
+        }
+
+    def request(self, client, path, params):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = client.get(path, params)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            else:
+                response.content
+            response.close()
+        return time.perf_counter() - started, timer.count, response
+
+    def measure(self, client, path, params, options):
+        for _ in range(options['warmup']):
+            self.request(client, path, params)
+        timings = []
+        queries = 0
+        for _ in range(options['repeat']):
+            duration, count, response = self.request(client, path, params)
+            timings.append(duration * 1000)
+            queries = max(queries, count)
+        return {
+            'status': response.status_code,
+            'p50': round(percentile(timings, 0.5), 2),
+            'p95': round(percentile(timings, 0.95), 2),
+            'queries': queries,
+        }
+
+    def compare(self, results, baseline, threshold):
+        regressions = []
+        for name, result in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            change = (result['p95'] - previous['p95']) / max(
+                previous['p95'], 0.01
+            ) * 100
+            self.stdout.write(
+                f'{name}: p95 {previous["p95"]} -> {result["p95"]} ms '
+                f'({change:+.0f}%), запросов {previous["queries"]} -> '
+                f'{result["queries"]}'
+            )
+            if change > threshold or result['queries'] > previous['queries']:
+                regressions.append(name)
+        return regressions
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть больше нуля.')
+        if options['user']:
+            user = User.objects.get(id=options['user'])
+        else:
+            user = User.objects.annotate(
+                cart_total=Count('cart_follower')
+            ).order_by('-cart_total').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей: сначала выполните generate_dataset.'
+            )
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        results = {}
+        self.stdout.write('сценарий\tстатус\tp50 ms\tp95 ms\tзапросов')
+        for name, (path, params) in self.get_scenarios().items():
+            if options['only'] and not any(
+                    part in name for part in options['only']):
+                continue
+            result = results[name] = self.measure(
+                client, path, params, options
+            )
+            self.stdout.write(
+                f'{name}\t{result["status"]}\t{result["p50"]}\t'
+                f'{result["p95"]}\t{result["queries"]}'
+            )
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+            regressions = self.compare(
+                results, baseline, options['threshold']
+            )
+            if regressions:
+                raise CommandError(
+                    'Ухудшились: ' + ', '.join(regressions)
+                )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from api.images import process
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Готовит уменьшенные копии фотографий рецептов, у которых их ещё '
+        'нет: для загруженных до обновления или не обработанных из-за ошибки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать копии для всех рецептов.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            recipes = recipes.exclude(renditions_image=F('image'))
+        processed = 0
+        for pk, image in recipes.values_list('id', 'image').iterator():
+            process(pk, image)
+            processed += 1
+        self.stdout.write(f'Обработано фотографий: {processed}')
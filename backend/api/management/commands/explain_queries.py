@@ -0,0 +1,116 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from api.views import FollowViewSet, RecipeViewSet
+from recipes.models import Ingredient, Tag
+from users.models import User
+
+PROBLEMS = {
+    'postgresql': (
+        ('seq scan', re.compile(r'Seq Scan on (\w+)')),
+        ('sort', re.compile(r'(?:^|->)\s*(?:Incremental )?Sort\s+\(', re.M)),
+    ),
+    'sqlite': (
+        ('seq scan', re.compile(r'\bSCAN (?:TABLE )?(\w+)(?!.*\bUSING\b)')),
+        ('sort', re.compile(r'USE TEMP B-TREE FOR (?:ORDER|GROUP) BY')),
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN для запросов API на текущих данных и сообщает '
+        'о последовательных сканированиях и сортировках.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int,
+            help='id пользователя, от имени которого строятся запросы.'
+        )
+        parser.add_argument(
+            '--ignore', nargs='*', default=['recipes_tag'],
+            help='Таблицы, сканирование которых не считается проблемой.'
+        )
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Завершиться с ошибкой, если найдены проблемы.'
+        )
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Печатать планы целиком.'
+        )
+
+    def get_view(self, viewset, user, params=None):
+        request = Request(RequestFactory().get('/', params or {}))
+        request.user = user
+        view = viewset()
+        view.request = request
+        view.action = 'list'
+        view.args = ()
+        view.kwargs = {}
+        view.format_kwarg = None
+        return view
+
+    def get_querysets(self, user):
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        author = User.objects.order_by('-recipes_count').first()
+        recipes_params = {
+            'recipes: feed': {},
+            'recipes: tags': {'tags': tags},
+            'recipes: author': {'author': author.id if author else 0},
+            'recipes: favorites': {'is_favorited': 1},
+            'recipes: shopping cart': {'is_in_shopping_cart': 1},
+        }
+        for name, params in recipes_params.items():
+            view = self.get_view(RecipeViewSet, user, params)
+            page_size = view.paginator.page_size
+            yield name, view.filter_queryset(view.get_queryset())[:page_size]
+        view = self.get_view(FollowViewSet, user, {'recipes_limit': 3})
+        yield 'subscriptions: list', view.get_queryset()[:6]
+        authors = list(user.follower.values_list('author_id', flat=True))
+        yield 'subscriptions: recipes', view.get_recipes_preview().filter(
+            author__in=authors
+        )
+        yield 'shopping cart: download', RecipeViewSet.get_shopping_list(user)
+        yield 'ingredients: search', Ingredient.objects.filter(
+            name__istartswith='мол'
+        )
+
+    def find_problems(self, plan, ignore):
+        problems = []
+        for kind, pattern in PROBLEMS.get(connection.vendor, ()):
+            for match in pattern.finditer(plan):
+                table = match.group(1) if match.groups() else None
+                if table in ignore:
+                    continue
+                problems.append(f'{kind} {table}' if table else kind)
+        return problems
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = User.objects.get(id=options['user'])
+        else:
+            user = User.objects.annotate(
+                cart_total=Count('cart_follower')
+            ).order_by('-cart_total').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей: сначала заполните базу данными.'
+            )
+        failed = 0
+        for name, queryset in self.get_querysets(user):
+            plan = queryset.explain()
+            problems = self.find_problems(plan, set(options['ignore']))
+            status = 'OK' if not problems else ', '.join(problems)
+            self.stdout.write(f'{name}: {status}')
+            if options['verbose_plans'] or problems:
+                self.stdout.write(f'    {plan}'.replace('\n', '\n    '))
+            failed += bool(problems)
+        if options['check'] and failed:
+            raise CommandError(f'Запросов с проблемами: {failed}')
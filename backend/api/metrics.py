@@ -0,0 +1,214 @@
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+from django.conf import settings
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+METRICS = {
+    'foodgram_request_duration_seconds': (
+        'Время обработки запроса.', DURATION_BUCKETS
+    ),
+    'foodgram_db_queries': (
+        'Число SQL-запросов за запрос.', QUERY_BUCKETS
+    ),
+    'foodgram_db_duration_seconds': (
+        'Суммарное время SQL-запросов за запрос.', DURATION_BUCKETS
+    ),
+}
+LABELS = ('view', 'method')
+
+# Сумма файлов завершившихся процессов и блокировка её обновления.
+ARCHIVE_NAME = 'archive.json'
+LOCK_NAME = '.lock'
+
+COUNTERS = {
+    'foodgram_recipe_cache_hits_total': 'Записи рецептов, найденные в кэше.',
+    'foodgram_recipe_cache_misses_total': 'Записи рецептов, собранные заново.',
+}
+
+
+class Histograms:
+    """
+    Гистограммы по представлениям и счётчики в памяти процесса.
+
+    Гистограммы — {метрика: {"view|method": [счётчики корзин..., сумма,
+    число]}}, счётчики — {метрика: число}. С METRICS_DIR каждый процесс
+    раз в METRICS_FLUSH_INTERVAL секунд сохраняет своё состояние
+    в файл "<pid>-<uuid>.json", а страница метрик складывает файлы всех
+    воркеров gunicorn. Файлы завершившихся процессов она переносит
+    в ARCHIVE_NAME, чтобы счётчики не уменьшались, а каталог не рос.
+    """
+
+    def __init__(self):
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        """Новый процесс начинает свои счётчики в своём файле."""
+        self._lock = threading.Lock()
+        self._state = {name: {} for name in METRICS}
+        self._counters = dict.fromkeys(COUNTERS, 0)
+        self._flushed_at = 0
+        self._file_name = f'{os.getpid()}-{uuid.uuid4().hex}.json'
+
+    def observe(self, view, method, values):
+        key = f'{view}|{method}'
+        with self._lock:
+            for name, value in values.items():
+                buckets = METRICS[name][1]
+                row = self._state[name].get(key)
+                if row is None:
+                    row = self._state[name][key] = [0] * (len(buckets) + 2)
+                position = bisect_left(buckets, value)
+                if position < len(buckets):
+                    row[position] += 1
+                row[-2] += value
+                row[-1] += 1
+        self.flush()
+
+    def increment(self, name, value=1):
+        if not value:
+            return
+        with self._lock:
+            self._counters[name] += value
+        self.flush()
+
+    def get_path(self, file_name=None):
+        return os.path.join(settings.METRICS_DIR, file_name or self._file_name)
+
+    def flush(self, force=False):
+        if not settings.METRICS_DIR:
+            return
+        now = time.monotonic()
+        if not force and now - self._flushed_at < (
+                settings.METRICS_FLUSH_INTERVAL):
+            return
+        self._flushed_at = now
+        with self._lock:
+            content = json.dumps(
+                {'histograms': self._state, 'counters': self._counters}
+            )
+        path = self.get_path()
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        with open(f'{path}.tmp', 'w') as file:
+            file.write(content)
+        os.replace(f'{path}.tmp', path)
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _add(total, counters, state):
+        for name, rows in state.get('histograms', {}).items():
+            if name not in total:
+                continue
+            for key, row in rows.items():
+                current = total[name].setdefault(key, [0] * len(row))
+                for position, value in enumerate(row):
+                    current[position] += value
+        for name, value in state.get('counters', {}).items():
+            if name in counters:
+                counters[name] += value
+
+    @staticmethod
+    def _is_dead(file_name):
+        pid = file_name.split('-', 1)[0]
+        if not pid.isdigit():
+            return False
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+    def archive(self, file_names):
+        """
+        Прибавляет файлы завершившихся процессов к ARCHIVE_NAME и удаляет
+        их. Вызывается под блокировкой каталога.
+        """
+        dead = [name for name in file_names if self._is_dead(name)]
+        if not dead:
+            return
+        path = self.get_path(ARCHIVE_NAME)
+        archive = self._read(path) or {}
+        total = archive.get('histograms', {name: {} for name in METRICS})
+        counters = archive.get('counters', dict.fromkeys(COUNTERS, 0))
+        for file_name in dead:
+            state = self._read(self.get_path(file_name))
+            if state is not None:
+                self._add(total, counters, state)
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump({'histograms': total, 'counters': counters}, file)
+        os.replace(f'{path}.tmp', path)
+        for file_name in dead:
+            os.remove(self.get_path(file_name))
+
+    def collect(self):
+        """Гистограммы и счётчики всех процессов, сложенные по меткам."""
+        if not settings.METRICS_DIR:
+            with self._lock:
+                return (
+                    json.loads(json.dumps(self._state)), dict(self._counters)
+                )
+        self.flush(force=True)
+        total = {name: {} for name in METRICS}
+        counters = dict.fromkeys(COUNTERS, 0)
+        with open(self.get_path(LOCK_NAME), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            file_names = [
+                name for name in os.listdir(settings.METRICS_DIR)
+                if name.endswith('.json') and name != ARCHIVE_NAME
+            ]
+            self.archive(file_names)
+            for file_name in (ARCHIVE_NAME, *file_names):
+                state = self._read(self.get_path(file_name))
+                if state is not None:
+                    self._add(total, counters, state)
+        return total, counters
+
+    def render(self):
+        """Текст в формате Prometheus exposition 0.0.4."""
+        histograms, counters = self.collect()
+        lines = []
+        for name, rows in histograms.items():
+            help_text, buckets = METRICS[name]
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for key, row in sorted(rows.items()):
+                labels = ','.join(
+                    f'{label}="{value}"'
+                    for label, value in zip(LABELS, key.split('|'))
+                )
+                cumulative = 0
+                for bound, count in zip(buckets, row):
+                    cumulative += count
+                    lines.append(
+                        f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+                    )
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {row[-1]}')
+                lines.append(f'{name}_sum{{{labels}}} {row[-2]}')
+                lines.append(f'{name}_count{{{labels}}} {row[-1]}')
+        for name, value in counters.items():
+            lines.append(f'# HELP {name} {COUNTERS[name]}')
+            lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+histograms = Histograms()
@@ -0,0 +1,124 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import replicas
+from .metrics import histograms
+from .nplusone import QueryShapes
+
+
+class QueryTimer:
+    """execute_wrapper, считающий запросы к базе и их время."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def get_view_name(view_func, method):
+    """RecipeViewSet.list, RecipeViewSet.download_shopping_cart и т. п."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__qualname__', repr(view_func))
+    actions = getattr(view_func, 'actions', None)
+    if actions:
+        return f'{view_class.__name__}.{actions.get(method.lower(), method)}'
+    return view_class.__name__
+
+
+class ViewNameMixin:
+    """Сохраняет в request.view_name имя представления для метрик и логов."""
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.view_name = get_view_name(view_func, request.method)
+
+
+class MetricsMiddleware(ViewNameMixin):
+    """
+    Время ответа, число и время SQL-запросов по каждому представлению.
+
+    Запросы, выполненные при отдаче потокового ответа, уже после выхода
+    из представления, не учитываются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        view = getattr(request, 'view_name', None)
+        if view is not None:
+            histograms.observe(view, request.method, {
+                'foodgram_request_duration_seconds':
+                    time.perf_counter() - started,
+                'foodgram_db_queries': timer.count,
+                'foodgram_db_duration_seconds': timer.duration,
+            })
+        return response
+
+
+class NPlusOneMiddleware(ViewNameMixin):
+    """
+    Ищет одинаковые по форме SQL-запросы, повторённые за один запрос.
+
+    Пишет в лог представление, форму запроса и стек; с NPLUSONE_RAISE
+    (в тестах) выбрасывает NPlusOneError. Подключается только при
+    NPLUSONE_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        shapes = QueryShapes()
+        with shapes.capture():
+            response = self.get_response(request)
+        shapes.report(
+            getattr(request, 'view_name', request.path),
+            raise_error=settings.NPLUSONE_RAISE
+        )
+        return response
+
+
+class ReplicaMiddleware:
+    """
+    Разрешает чтение с реплик безопасным запросам к API.
+
+    После успешного изменяющего запроса клиент с тем же заголовком
+    Authorization на REPLICA_PIN_SECONDS читает только с основной базы и
+    сразу видит свои изменения.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in ('GET', 'HEAD', 'OPTIONS')
+        allowed = (
+            safe and request.path.startswith('/api/')
+            and bool(settings.DATABASE_REPLICAS)
+            and not replicas.is_pinned(request)
+        )
+        token = replicas.use_replicas.set(allowed)
+        try:
+            response = self.get_response(request)
+        finally:
+            replicas.use_replicas.reset(token)
+        if not safe and response.status_code < 400:
+            replicas.pin(request)
+        return response
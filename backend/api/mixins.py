@@ -0,0 +1,81 @@
+import gzip
+import hashlib
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from .cache import get_model_version
+from .replicas import read_from_primary
+
+LIST_BODY_TIMEOUT = 60 * 60 * 24
+
+
+class ConditionalListMixin:
+    """
+    Список справочника с ETag/Last-Modified и готовым сжатым телом.
+
+    Версия берётся из счётчика, который сигналы меняют при любой записи
+    в модель. Полный список без фильтров сериализуется и сжимается один
+    раз на версию.
+    """
+    _bodies = None
+
+    def get_list_version(self):
+        return get_model_version(self.queryset.model)
+
+    def list(self, request, *args, **kwargs):
+        version, modified = self.get_list_version()
+        query = hashlib.md5(request.META.get('QUERY_STRING', '').encode())
+        # Сжатое и несжатое тела — разные представления, у каждого свой ETag.
+        compressed = not request.query_params and (
+            'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        etag = quote_etag('-'.join(filter(None, (
+            version, query.hexdigest()[:8], compressed and 'gzip'
+        ))))
+        response = get_conditional_response(
+            request, etag=etag, last_modified=int(modified)
+        )
+        if response is None:
+            if request.query_params:
+                response = self.get_filtered_response(
+                    request, *args, **kwargs
+                )
+            else:
+                response = self.get_full_list_response(version, compressed)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modified)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+    def get_filtered_response(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def get_full_list_bodies(self, version):
+        bodies = type(self)._bodies
+        if bodies is not None and bodies[0] == version:
+            return bodies[1]
+        key = f'list-body:{self.queryset.model._meta.label_lower}:{version}'
+        body = cache.get(key)
+        if body is None:
+            with read_from_primary():
+                serializer = self.get_serializer(
+                    self.get_queryset(), many=True
+                )
+                content = JSONRenderer().render(serializer.data)
+            body = (content, gzip.compress(content))
+            cache.set(key, body, LIST_BODY_TIMEOUT)
+        type(self)._bodies = (version, body)
+        return body
+
+    def get_full_list_response(self, version, compressed):
+        content, gzipped = self.get_full_list_bodies(version)
+        if compressed:
+            response = HttpResponse(gzipped, content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(content, content_type='application/json')
+        return response
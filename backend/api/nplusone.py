@@ -0,0 +1,103 @@
+import logging
+import os
+import re
+import traceback
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_RULES = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+)
+STACK_DEPTH = 8
+IGNORED_FILES = (
+    __file__, os.path.join(os.path.dirname(__file__), 'middleware.py')
+)
+
+
+class NPlusOneError(Exception):
+    """Один и тот же запрос выполнился за запрос слишком много раз."""
+
+
+def fingerprint(sql):
+    """Форма запроса без литералов: одинакова для всех id и списков IN."""
+    for pattern, replacement in FINGERPRINT_RULES:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def get_stack():
+    """Последние кадры кода проекта, из которых выполнен запрос."""
+    frames = [
+        frame for frame in traceback.extract_stack()[:-2]
+        if frame.filename.startswith(settings.BASE_DIR)
+        and 'site-packages' not in frame.filename
+        and frame.filename not in IGNORED_FILES
+    ]
+    return ''.join(traceback.format_list(frames[-STACK_DEPTH:]))
+
+
+class QueryShapes:
+    """
+    execute_wrapper, считающий повторы одной формы SQL.
+
+    Стек сохраняется один раз для формы — когда она достигает порога.
+    """
+
+    def __init__(self, threshold=None):
+        if threshold is None:
+            threshold = settings.NPLUSONE_THRESHOLD
+        self.threshold = threshold
+        self.counts = Counter()
+        self.stacks = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        shape = fingerprint(sql)
+        self.counts[shape] += 1
+        if self.counts[shape] == self.threshold:
+            self.stacks[shape] = get_stack()
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def capture(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def get_repeated(self):
+        return {
+            shape: count for shape, count in self.counts.items()
+            if count >= self.threshold
+        }
+
+    def report(self, view, raise_error=False):
+        repeated = self.get_repeated()
+        for shape, count in repeated.items():
+            logger.warning(
+                'N+1 в %s: запрос выполнен %s раз: %s\n%s',
+                view, count, shape, self.stacks.get(shape, '')
+            )
+        if repeated and raise_error:
+            raise NPlusOneError(
+                f'{view}: повторяющиеся запросы ' + '; '.join(
+                    f'{count}× {shape}' for shape, count in repeated.items()
+                )
+            )
+
+
+@contextmanager
+def detect_n_plus_one(threshold=None, name='блок кода'):
+    """Для тестов: падает, если внутри блока есть N+1."""
+    shapes = QueryShapes(threshold)
+    with shapes.capture():
+        yield shapes
+    shapes.report(name, raise_error=True)
@@ -1,6 +1,101 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CountByPkPaginator(Paginator):
+    """Считает строки без аннотаций, нужных только для вывода страницы."""
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return len(self.object_list)
+        return self.object_list.values('pk').order_by().count()
 
 
 class LimitPageSizePagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+    django_paginator_class = CountByPkPaginator
+
+
+class RecipeCursorPagination(CursorPagination):
+    """
+    Курсор с позицией (pub_date, id). DRF фильтрует только по первому
+    полю сортировки и пропускает рецепты с той же датой смещением, поэтому
+    позицию по всем полям ordering проверяет paginate_queryset.
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+    position_separator = '|'
+    position = None
+
+    def decode_cursor(self, request):
+        # Пустой ?cursor= запрашивает первую страницу ленты.
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        cursor = super().decode_cursor(request)
+        self.position = cursor.position
+        return cursor._replace(position=None)
+
+    def get_position_filter(self, model, position, reverse):
+        values = position.split(self.position_separator)
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            try:
+                value = model._meta.get_field(name).to_python(value)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            lookup = 'gt' if field.startswith('-') == reverse else 'lt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.position = None
+        cursor = self.decode_cursor(request)
+        if self.position is not None:
+            queryset = queryset.filter(self.get_position_filter(
+                queryset.model, self.position, cursor.reverse
+            ))
+        page = super().paginate_queryset(queryset, request, view)
+        if self.position is not None:
+            if cursor.reverse:
+                self.has_next = True
+                self.next_position = self.position
+            else:
+                self.has_previous = True
+                self.previous_position = self.position
+        return page
+
+    def _get_position_from_instance(self, instance, ordering):
+        return self.position_separator.join(
+            str(getattr(instance, field.lstrip('-'))) for field in ordering
+        )
+
+
+class RecipePagination(LimitPageSizePagination):
+    """Постраничная выдача; с параметром cursor — курсорная, без COUNT."""
+    cursor_query_param = 'cursor'
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            self.cursor_paginator = RecipeCursorPagination()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
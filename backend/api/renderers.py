@@ -0,0 +1,56 @@
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class FormatParamNegotiation(DefaultContentNegotiation):
+    """
+    Формат только из ?format=, без него — первый рендерер представления.
+
+    Заголовок Accept не учитывается: клиенты API шлют application/json
+    по умолчанию и ждут при этом привычный PDF.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        export_format = format_suffix or request.query_params.get(
+            self.settings.URL_FORMAT_OVERRIDE
+        )
+        if export_format:
+            renderers = self.filter_renderers(renderers, export_format)
+        return renderers[0], renderers[0].media_type
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """
+    Формат списка покупок для ?format=.
+
+    Сам файл отдаёт представление потоком, рендерер нужен только для
+    согласования формата и для ответов с ошибками.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return JSONRenderer().render(data)
+
+
+class PDFRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class PlainTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class ShoppingListJSONRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
@@ -0,0 +1,75 @@
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Включается middleware только на время безопасных запросов к API.
+use_replicas = ContextVar('use_replicas', default=False)
+
+# Таблицы, которые всегда читаются с основной базы: токен, выданный
+# только что, мог ещё не доехать до реплики.
+PRIMARY_ONLY = {'authtoken.token'}
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Чтения с основной базы для данных, которые кэшируются для всех:
+    отстающая реплика не должна попасть в кэш под новой версией.
+    """
+    token = use_replicas.set(False)
+    try:
+        yield
+    finally:
+        use_replicas.reset(token)
+
+
+def get_pin_key(request):
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    digest = hashlib.sha1(authorization.encode()).hexdigest()
+    return f'replica-pin:{digest}'
+
+
+def pin(request):
+    """Отправляет чтения клиента на основную базу на REPLICA_PIN_SECONDS."""
+    if not settings.DATABASE_REPLICAS:
+        return
+    key = get_pin_key(request)
+    if key is not None:
+        cache.set(key, 1, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(request):
+    key = get_pin_key(request)
+    return key is not None and cache.get(key) is not None
+
+
+class ReplicaRouter:
+    """
+    Чтения — на случайную реплику из DATABASE_REPLICAS, если это
+    разрешено для текущего запроса, запись — всегда на основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or not use_replicas.get():
+            return None
+        if model._meta.label_lower in PRIMARY_ONLY:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,124 @@
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, connections
+from django.db.models import Case, F, IntegerField, Value, When
+
+from recipes.models import Ingredient, IngredientRecipe, Recipe
+
+from .cache import bump_model_version, get_model_version
+from .indexes import VersionedIndex
+from .ingredient_index import fold
+
+UPDATE_DOCUMENTS_SQL = """
+    UPDATE recipes_recipe AS recipe SET search_vector =
+        setweight(to_tsvector(%(config)s, recipe.name), 'A')
+        || setweight(to_tsvector(%(config)s, recipe.text), 'B')
+        || setweight(to_tsvector(%(config)s, coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM recipes_ingredientrecipe AS amount
+            JOIN recipes_ingredient AS ingredient
+                ON ingredient.id = amount.ingredient_id
+            WHERE amount.recipe_id = recipe.id
+        ), '')), 'C')
+    WHERE recipe.id = ANY(%(ids)s)
+"""
+
+# Веса полей для запасного индекса, как у setweight A/B/C.
+WEIGHTS = {'name': 1.0, 'text': 0.4, 'ingredients': 0.2}
+
+
+def tokenize(text):
+    return re.findall(r'\w+', fold(text))
+
+
+def update_documents(ids):
+    """Обновляет поисковый документ рецептов после изменения."""
+    ids = list(ids)
+    if not ids:
+        return
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(UPDATE_DOCUMENTS_SQL, {
+                'config': settings.RECIPE_SEARCH_CONFIG, 'ids': ids
+            })
+    else:
+        bump_model_version(Recipe)
+
+
+class RecipeSearchIndex(VersionedIndex):
+    """
+    Инвертированный индекс рецептов в памяти процесса.
+
+    Используется вместо tsvector на базах без полнотекстового поиска
+    (SQLite в тестах и при локальной разработке).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._postings = {}
+
+    def current_version(self):
+        return (
+            get_model_version(Recipe)[0], get_model_version(Ingredient)[0]
+        )
+
+    def load(self):
+        postings = defaultdict(lambda: defaultdict(float))
+        for pk, name, text in Recipe.objects.values_list(
+                'id', 'name', 'text').iterator():
+            for field, value in (('name', name), ('text', text)):
+                for token in tokenize(value):
+                    postings[token][pk] += WEIGHTS[field]
+        for pk, name in IngredientRecipe.objects.values_list(
+                'recipe_id', 'ingredient__name').iterator():
+            for token in tokenize(name):
+                postings[token][pk] += WEIGHTS['ingredients']
+        self._postings = {
+            token: dict(scores) for token, scores in postings.items()
+        }
+
+    def search(self, query, limit):
+        """id рецептов, содержащих все слова запроса, по убыванию веса."""
+        self.refresh()
+        postings = self._postings
+        tokens = set(tokenize(query))
+        if not tokens:
+            return []
+        matches = [postings.get(token, {}) for token in tokens]
+        matches.sort(key=len)
+        scores = dict(matches[0])
+        for match in matches[1:]:
+            scores = {
+                pk: score + match[pk]
+                for pk, score in scores.items() if pk in match
+            }
+        ranked = sorted(scores, key=lambda pk: (-scores[pk], -pk))
+        return ranked[:limit]
+
+
+recipe_search_index = RecipeSearchIndex()
+
+
+def search(queryset, query):
+    """Отбирает рецепты по запросу и сортирует их по релевантности."""
+    if connections[queryset.db].vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=settings.RECIPE_SEARCH_CONFIG
+        )
+        return queryset.annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).filter(search_vector=search_query).order_by(
+            '-rank', '-pub_date', '-id'
+        )
+    ids = recipe_search_index.search(query, settings.RECIPE_SEARCH_LIMIT)
+    return queryset.filter(id__in=ids).annotate(
+        rank=Case(
+            *(When(id=pk, then=Value(-position))
+              for position, pk in enumerate(ids)),
+            default=Value(0),
+            output_field=IntegerField()
+        )
+    ).order_by('-rank', '-pub_date', '-id')
@@ -1,12 +1,25 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django.forms import ValidationError
 from drf_extra_fields.fields import Base64ImageField
+from rest_framework.fields import ImageField
 from rest_framework import serializers
+from rest_framework.exceptions import NotFound
 
+from recipes import shopping_list
+from recipes.batch import writing_ingredients
 from recipes.models import (Favorite, Follow, Ingredient, IngredientRecipe,
                             Recipe, ShoppingCart, Tag)
 from users.serializers import UserSerializer
 
+from . import cookable, images, search
+
 
 class IngredientSerializer(serializers.ModelSerializer):
 
@@ -34,6 +47,30 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class ImageRenditionsField(serializers.Field):
+    """Ссылки на уменьшенные копии фото: {копия: {формат: url}}."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        renditions = images.get_renditions(recipe)
+        if renditions is None:
+            return None
+        request = self.context.get('request')
+        urls = {}
+        for rendition, paths in renditions.items():
+            urls[rendition] = {}
+            for image_format, path in paths.items():
+                url = default_storage.url(path)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls[rendition][image_format] = url
+        return urls
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     tags = TagSerializer(many=True)
@@ -42,12 +79,9 @@ class RecipeSerializer(serializers.ModelSerializer):
         read_only=True,
         source='ingredient_amount'
     )
-    is_favorited = serializers.SerializerMethodField(
-        method_name='get_is_favorited'
-    )
-    is_in_shopping_cart = serializers.SerializerMethodField(
-        method_name='get_is_in_shopping_cart'
-    )
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = Recipe
@@ -57,24 +91,50 @@ class RecipeSerializer(serializers.ModelSerializer):
             'text',
             'author',
             'image',
+            'image_renditions',
             'ingredients',
             'tags',
             'cooking_time',
+            'favorites_count',
             'is_favorited',
             'is_in_shopping_cart'
         )
 
-    def get_is_favorited(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            return Favorite.objects.filter(recipe=obj, user=user).exists()
-        return False
 
-    def get_is_in_shopping_cart(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            return ShoppingCart.objects.filter(recipe=obj, user=user).exists()
-        return False
+class RecipeImageField(Base64ImageField):
+    """
+    Фото рецепта строкой base64 или файлом из multipart/form-data.
+
+    Размер проверяется до декодирования base64, а стороны — по заголовку
+    изображения, до распаковки пикселей.
+    """
+
+    def check_size(self, size):
+        if size > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise serializers.ValidationError(
+                'Файл больше '
+                f'{settings.RECIPE_IMAGE_MAX_SIZE // (1024 * 1024)} МБ.'
+            )
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            payload = data.partition(';base64,')[2] or data
+            self.check_size(len(payload) * 3 // 4)
+            image = super().to_internal_value(data)
+        elif isinstance(data, UploadedFile):
+            self.check_size(data.size)
+            extension = os.path.splitext(data.name)[1].lower()
+            data.name = self.get_file_name(data) + extension
+            image = ImageField.to_internal_value(self, data)
+        else:
+            return super().to_internal_value(data)
+        if image is not None:
+            if max(image.image.size) > settings.RECIPE_IMAGE_MAX_SIDE:
+                raise serializers.ValidationError(
+                    'Сторона изображения больше '
+                    f'{settings.RECIPE_IMAGE_MAX_SIDE} пикселей.'
+                )
+        return image
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
@@ -85,7 +145,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         queryset=Tag.objects.all(),
         many=True,
     )
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = RecipeImageField(max_length=None, use_url=True)
 
     class Meta:
         model = Recipe
@@ -99,49 +159,116 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
 
+    def to_internal_value(self, data):
+        if hasattr(data, 'getlist'):
+            data = self.parse_form(data)
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def parse_form(data):
+        """
+        Поля multipart/form-data: tags повторяются, ingredients — JSON.
+        """
+        parsed = data.dict()
+        if 'tags' in data:
+            parsed['tags'] = data.getlist('tags')
+        if 'ingredients' in data:
+            try:
+                parsed['ingredients'] = json.loads(data['ingredients'])
+            except ValueError:
+                raise serializers.ValidationError(
+                    {'ingredients': 'Ожидается JSON-список ингредиентов.'}
+                )
+        return parsed
+
     def validate(self, data):
-        ingredients_data = data['ingredients']
-        ingredients_unique_list = []
+        ingredients_data = data.get('ingredients')
+        if ingredients_data is None:
+            return data
+        ingredient_ids = set()
         for ingredient in ingredients_data:
             if int(ingredient['amount']) < 1:
                 raise serializers.ValidationError(
                     'Количество должно быть больше 0!'
                 )
-            ingredient_to_check = get_object_or_404(
-                                                    Ingredient,
-                                                    id=ingredient['id']
-                                                    )
-            if ingredient_to_check in ingredients_unique_list:
+            if ingredient['id'] in ingredient_ids:
                 raise serializers.ValidationError(
                     'Повтор ингредиентов'
                 )
-            ingredients_unique_list.append(ingredient_to_check)
-        data['ingredients'] = ingredients_data
+            ingredient_ids.add(ingredient['id'])
+        existing = Ingredient.objects.filter(id__in=ingredient_ids).count()
+        if existing != len(ingredient_ids):
+            raise NotFound('Ингредиент не найден')
         return data
 
     def add_ingredients(self, recipe, ingredients_data):
-        for ingredient in ingredients_data:
-            IngredientRecipe.objects.create(
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
                 ingredient_id=ingredient.get('id'),
                 recipe=recipe,
                 amount=ingredient.get('amount')
             )
+            for ingredient in ingredients_data
+        )
 
+    def update_ingredients(self, recipe, ingredients_data):
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients_data
+        }
+        current = {
+            item.ingredient_id: item
+            for item in IngredientRecipe.objects.filter(recipe=recipe)
+        }
+        deltas = {}
+        removed = []
+        changed = []
+        for ingredient_id, item in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is None:
+                removed.append(item.id)
+                deltas[ingredient_id] = -item.amount
+            elif item.amount != amount:
+                deltas[ingredient_id] = amount - item.amount
+                item.amount = amount
+                changed.append(item)
+        with writing_ingredients(recipe.id):
+            if removed:
+                IngredientRecipe.objects.filter(id__in=removed).delete()
+            if changed:
+                IngredientRecipe.objects.bulk_update(changed, ('amount',))
+        added = [
+            ingredient for ingredient in ingredients_data
+            if ingredient['id'] not in current
+        ]
+        if added:
+            self.add_ingredients(recipe, added)
+        for ingredient in added:
+            deltas[ingredient['id']] = ingredient['amount']
+        if deltas:
+            shopping_list.change_recipe(recipe, deltas)
+            cookable.ingredients_changed([recipe.id])
+
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context['request'].user
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(author=author, **validated_data)
         self.add_ingredients(recipe, ingredients)
+        cookable.ingredients_changed([recipe.id])
         recipe.tags.set(tags)
+        search.update_documents([recipe.id])
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        recipe.ingredients.clear()
-        recipe.tags.set(tags)
-        self.add_ingredients(recipe, ingredients)
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if tags is not None:
+            recipe.tags.set(tags)
+        if ingredients is not None:
+            self.update_ingredients(recipe, ingredients)
         return super().update(recipe, validated_data)
 
 
@@ -160,6 +287,8 @@ class FollowSerializer(serializers.ModelSerializer):
     recipes = serializers.SerializerMethodField(
         read_only=True,
         method_name='get_recipes')
+    followers_count = serializers.ReadOnlyField(
+        source='author.followers_count')
 
     class Meta:
         model = Follow
@@ -171,26 +300,23 @@ class FollowSerializer(serializers.ModelSerializer):
             'last_name',
             'is_subscribed',
             'recipes',
-            'recipes_count'
+            'recipes_count',
+            'followers_count'
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            return Follow.objects.filter(
-                user=user, author=obj.author
-            ).exists()
-        return False
+        return obj.user_id == self.context['request'].user.id
 
     def get_recipes_count(self, obj):
-        return obj.author.recipes.count()
+        return obj.author.recipes_count
 
     def get_recipes(self, obj):
-        recipes_limit = self.context['recipes_limit']
-        if recipes_limit:
-            recipes = obj.author.recipes.all()[:int(recipes_limit)]
-        else:
+        recipes = getattr(obj.author, 'recipes_preview', None)
+        if recipes is None:
             recipes = obj.author.recipes.all()
+            recipes_limit = self.context['recipes_limit']
+            if recipes_limit:
+                recipes = recipes[:int(recipes_limit)]
         return FavoriteRecipeSerializer(recipes, many=True).data
 
 
@@ -247,10 +373,11 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
 
 class FavoriteRecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
     def validate(self, data):
@@ -0,0 +1,110 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes import deletion
+from recipes.batch import is_writing_ingredients
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import User
+
+from . import authentication, cache, cookable, images, search
+
+# Поля пользователя в кэшированной записи рецепта (блок author).
+AUTHOR_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+
+def _changes_any(created, update_fields, fields):
+    """
+    Меняет ли сохранение пользователя одно из полей fields: вход через
+    update_last_login сохраняет только last_login.
+    """
+    if created:
+        return False
+    return update_fields is None or not update_fields.isdisjoint(fields)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    cache.invalidate_recipes([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_document(sender, instance, **kwargs):
+    search.update_documents([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(sender, instance, **kwargs):
+    images.schedule(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_document(sender, **kwargs):
+    cache.bump_model_version(Recipe)
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def invalidate_recipe_ingredients(sender, instance, using, **kwargs):
+    # Сериализатор пишет состав пачкой, сам сообщает индексам и затем
+    # сохраняет рецепт: запись и документ обновит post_save рецепта.
+    if is_writing_ingredients(instance.recipe_id):
+        return
+    cache.invalidate_recipes([instance.recipe_id])
+    if not deletion.is_deleting(Recipe, instance.recipe_id, using):
+        search.update_documents([instance.recipe_id])
+    cookable.ingredients_changed([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_documents(sender, instance, created, **kwargs):
+    if created:
+        return
+    search.update_documents(IngredientRecipe.objects.filter(
+        ingredient=instance
+    ).values_list('recipe_id', flat=True))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_recipe_relations(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        cache.invalidate_recipes([instance.pk])
+    elif pk_set:
+        cache.invalidate_recipes(pk_set)
+    else:
+        cache.invalidate_all()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_reference(sender, **kwargs):
+    cache.bump_model_version(sender)
+    cache.invalidate_all()
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, created, update_fields, **kwargs):
+    if not _changes_any(created, update_fields, AUTHOR_FIELDS):
+        return
+    cache.invalidate_recipes(
+        list(instance.recipes.values_list('id', flat=True))
+    )
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    authentication.invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, update_fields,
+                           **kwargs):
+    if not _changes_any(created, update_fields,
+                        (*authentication.CACHED_USER_FIELDS, 'password')):
+        return
+    authentication.invalidate_tokens(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
@@ -0,0 +1,472 @@
+import json
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import update_last_login
+from django.core.cache import caches
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorite, Follow, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingCart, ShoppingListItem, Tag)
+from users.models import User
+
+from .nplusone import NPlusOneError, detect_n_plus_one
+
+TEST_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': f'tests-{alias}'}
+    for alias in ('default', 'versions')
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeQueryCountTest(TestCase):
+    """Число запросов к базе не зависит от размера страницы и рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pw'
+        )
+        authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com',
+                password='pw'
+            )
+            for i in range(5)
+        ]
+        Follow.objects.create(user=cls.user, author=authors[0])
+        tags = [
+            Tag.objects.create(name=f'tag{i}', slug=f'tag{i}',
+                               color=f'#00000{i}')
+            for i in range(3)
+        ]
+        ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name=f'ingredient{i}', measurement_unit='г')
+            for i in range(10)
+        ])
+        ingredients = list(Ingredient.objects.order_by('id'))
+        for i in range(100):
+            recipe = Recipe.objects.create(
+                name=f'recipe{i}', text='text', cooking_time=5,
+                author=authors[i % len(authors)]
+            )
+            recipe.tags.set(tags[:i % len(tags) + 1])
+            IngredientRecipe.objects.bulk_create([
+                IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                                 amount=j + 1)
+                for j, ingredient in enumerate(
+                    ingredients[:1 if i == 0 else len(ingredients)]
+                )
+            ])
+            if i % 10 == 0:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        cls.small_recipe = Recipe.objects.get(name='recipe0')
+        cls.large_recipe = Recipe.objects.get(name='recipe1')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def clear_cache(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+
+    def count_queries(self, url, cold):
+        if cold:
+            self.clear_cache()
+        else:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_list_does_not_depend_on_page_size(self):
+        for cold in (True, False):
+            with self.subTest(cold=cold):
+                one, data = self.count_queries(
+                    '/api/recipes/?limit=1', cold
+                )
+                self.assertEqual(len(data['results']), 1)
+                hundred, data = self.count_queries(
+                    '/api/recipes/?limit=100', cold
+                )
+                self.assertEqual(len(data['results']), 100)
+                self.assertEqual(one, hundred)
+
+    def test_detail_does_not_depend_on_recipe_size(self):
+        for cold in (True, False):
+            with self.subTest(cold=cold):
+                small, data = self.count_queries(
+                    f'/api/recipes/{self.small_recipe.id}/', cold
+                )
+                self.assertEqual(len(data['ingredients']), 1)
+                large, data = self.count_queries(
+                    f'/api/recipes/{self.large_recipe.id}/', cold
+                )
+                self.assertEqual(len(data['ingredients']), 10)
+                self.assertEqual(small, large)
+
+    def test_warm_cache_skips_representation_queries(self):
+        cold, _ = self.count_queries('/api/recipes/?limit=100', cold=True)
+        warm, _ = self.count_queries('/api/recipes/?limit=100', cold=False)
+        self.assertLess(warm, cold)
+
+    def test_user_flags_are_not_cached(self):
+        self.count_queries('/api/recipes/?limit=100', cold=True)
+        _, data = self.count_queries('/api/recipes/?limit=100', cold=False)
+        favorited = {
+            item['name'] for item in data['results'] if item['is_favorited']
+        }
+        self.assertEqual(favorited, {f'recipe{i}' for i in range(0, 100, 10)})
+        anonymous = APIClient().get('/api/recipes/?limit=100').json()
+        self.assertFalse(any(
+            item['is_favorited'] or item['author']['is_subscribed']
+            for item in anonymous['results']
+        ))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeCursorTest(TestCase):
+    """Курсор ленты проходит рецепты с одинаковой датой без смещений."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pw'
+        )
+        for i in range(7):
+            Recipe.objects.create(
+                name=f'recipe{i}', text='text', cooking_time=5,
+                author=author
+            )
+        pub_date = Recipe.objects.earliest('pub_date').pub_date
+        Recipe.objects.update(pub_date=pub_date)
+        cls.ids = list(Recipe.objects.order_by('-id').values_list(
+            'id', flat=True
+        ))
+
+    def get_page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [item['id'] for item in data['results']], data
+
+    def test_pages_follow_id_within_same_date(self):
+        seen = []
+        url = '/api/recipes/?limit=2&cursor='
+        pages = []
+        while url:
+            ids, data = self.get_page(url)
+            self.assertNotIn('o%3D', data['next'] or '')
+            seen += ids
+            pages.append((ids, data['previous']))
+            url = data['next']
+        self.assertEqual(seen, self.ids)
+        ids, _ = self.get_page(pages[-1][1])
+        self.assertEqual(ids, pages[-2][0])
+
+    def test_invalid_position(self):
+        response = self.client.get('/api/recipes/?cursor=cD14')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CascadeDeleteTest(TestCase):
+    """Каскадное удаление не обновляет счётчики удаляемых строк."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pw'
+        )
+        self.users = [
+            User.objects.create_user(
+                username=f'user{i}', email=f'user{i}@example.com',
+                password='pw'
+            )
+            for i in range(8)
+        ]
+        ingredient = Ingredient.objects.create(
+            name='ingredient', measurement_unit='г'
+        )
+        self.recipe = Recipe.objects.create(
+            name='recipe', text='text', cooking_time=5, author=self.author
+        )
+        IngredientRecipe.objects.create(
+            recipe=self.recipe, ingredient=ingredient, amount=10
+        )
+        for user in self.users:
+            Favorite.objects.create(user=user, recipe=self.recipe)
+            ShoppingCart.objects.create(user=user, recipe=self.recipe)
+            Follow.objects.create(user=user, author=self.author)
+        self.client = APIClient()
+
+    def test_recipe_delete(self):
+        self.client.force_authenticate(self.author)
+        with detect_n_plus_one(name='DELETE /api/recipes/<id>/'):
+            response = self.client.delete(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(ShoppingListItem.objects.exists())
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+    def test_user_delete(self):
+        with detect_n_plus_one(name='удаление пользователя'):
+            self.author.delete()
+        self.assertEqual(ShoppingListItem.objects.count(), 0)
+
+    def test_subscribe_returns_new_followers_count(self):
+        follower = User.objects.create_user(
+            username='follower', email='follower@example.com',
+            password='pw'
+        )
+        self.client.force_authenticate(follower)
+        response = self.client.post(
+            f'/api/users/{self.author.id}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['followers_count'], 9)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ShoppingListEditTest(TestCase):
+    """Список покупок следует за правкой состава в админке и через API."""
+
+    def setUp(self):
+        self.author = User.objects.create_superuser(
+            username='author', email='author@example.com', password='pw'
+        )
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pw'
+        )
+        self.ingredients = {
+            name: Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('a', 'b', 'c')
+        }
+        self.recipe = Recipe.objects.create(
+            name='recipe', text='text', cooking_time=5, author=self.author
+        )
+        self.rows = {
+            name: IngredientRecipe.objects.create(
+                recipe=self.recipe, ingredient=self.ingredients[name],
+                amount=amount
+            )
+            for name, amount in (('a', 10), ('b', 20))
+        }
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        response = self.client.post(
+            f'/api/recipes/{self.recipe.id}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def download(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return {
+            row['name']: row['amount']
+            for row in json.loads(b''.join(response.streaming_content))
+        }
+
+    def test_admin_edit(self):
+        self.assertEqual(self.download(), {'a': 10, 'b': 20})
+        admin = APIClient()
+        admin.force_login(self.author)
+        url = '/admin/recipes/ingredientrecipe/'
+        for path, data in (
+            (f'{self.rows["a"].id}/change/', {
+                'recipe': self.recipe.id,
+                'ingredient': self.ingredients['a'].id, 'amount': 15,
+            }),
+            ('add/', {
+                'recipe': self.recipe.id,
+                'ingredient': self.ingredients['c'].id, 'amount': 5,
+            }),
+            (f'{self.rows["b"].id}/delete/', {'post': 'yes'}),
+        ):
+            response = admin.post(url + path, data)
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.download(), {'a': 15, 'c': 5})
+
+    def test_api_edit(self):
+        author = APIClient()
+        author.force_authenticate(self.author)
+        with mock.patch('api.search.update_documents') as update_documents:
+            response = author.patch(
+                f'/api/recipes/{self.recipe.id}/',
+                {'ingredients': [
+                    {'id': self.ingredients['a'].id, 'amount': 12},
+                    {'id': self.ingredients['c'].id, 'amount': 3},
+                ]},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        # Удалённые строки не обновляют документ по одной.
+        update_documents.assert_called_once_with([self.recipe.id])
+        self.assertEqual(self.download(), {'a': 12, 'c': 3})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class UserSaveInvalidationTest(TestCase):
+    """Вход пользователя не сбрасывает его записи и токены."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='author', email='author@example.com', password='pw'
+        )
+
+    def test_login_skips_invalidation(self):
+        with CaptureQueriesContext(connection) as queries:
+            update_last_login(None, self.user)
+        self.assertEqual(len(queries), 1)
+        self.assertFalse(connection.run_on_commit)
+
+    def test_profile_change_invalidates(self):
+        self.user.first_name = 'Автор'
+        with CaptureQueriesContext(connection) as queries:
+            self.user.save()
+        self.assertGreater(len(queries), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class NPlusOneDetectorTest(TestCase):
+    """Детектор ловит повторы одного запроса и включён в тестах."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(5):
+            author = User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com',
+                password='pw'
+            )
+            Recipe.objects.create(
+                name=f'recipe{i}', text='text', cooking_time=5,
+                author=author
+            )
+
+    def test_detects_lazy_loading(self):
+        with self.assertLogs('api.nplusone', 'WARNING') as logs:
+            with self.assertRaises(NPlusOneError):
+                with detect_n_plus_one(threshold=3):
+                    for recipe in Recipe.objects.all():
+                        recipe.author.username
+        self.assertIn('users_user', logs.output[0])
+
+    def test_select_related_passes(self):
+        with detect_n_plus_one(threshold=3) as shapes:
+            for recipe in Recipe.objects.select_related('author'):
+                recipe.author.username
+        self.assertEqual(shapes.get_repeated(), {})
+
+    def test_middleware_installed_in_tests(self):
+        self.assertTrue(settings.NPLUSONE_RAISE)
+        self.assertIn('api.middleware.NPlusOneMiddleware', settings.MIDDLEWARE)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ReplicaRoutingTest(TransactionTestCase):
+    """
+    Чтения API идут на реплику, а клиент после записи читает с основной
+    базы. TransactionTestCase: внутри транзакции TestCase роутер всегда
+    выбирает основную базу.
+    """
+    databases = {'default', 'replica1'}
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pw'
+        )
+        self.recipe = Recipe.objects.create(
+            name='recipe', text='text', cooking_time=5, author=author
+        )
+
+    def get_client(self, username):
+        user = User.objects.create_user(
+            username=username, email=f'{username}@example.com',
+            password='pw'
+        )
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user)}'
+        )
+        return client
+
+    def count_reads(self, client):
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections['replica1']) as replica:
+                response = client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['id'], self.recipe.id)
+        return len(primary), len(replica)
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(settings.DATABASE_REPLICAS, ['replica1'])
+        _, replica = self.count_reads(APIClient())
+        self.assertGreater(replica, 0)
+
+    def test_pinned_client_reads_primary(self):
+        writer = self.get_client('writer')
+        response = writer.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        primary, replica = self.count_reads(writer)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+        _, replica = self.count_reads(self.get_client('reader'))
+        self.assertGreater(replica, 0)
+
+
+@override_settings(CACHES=TEST_CACHES, DATABASE_REPLICAS=[])
+class CachedTokenTest(TransactionTestCase):
+    """
+    Кэш токенов: попадание не читает authtoken_token, а выход
+    и деактивация сразу закрывают доступ. TransactionTestCase: записи
+    сбрасываются в on_commit.
+    """
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pw'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def get_me(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/me/')
+        return response.status_code, [
+            query['sql'] for query in queries
+            if 'authtoken_token' in query['sql']
+        ]
+
+    def test_cache_hit_skips_token_query(self):
+        status, token_queries = self.get_me()
+        self.assertEqual(status, 200)
+        self.assertTrue(token_queries)
+        status, token_queries = self.get_me()
+        self.assertEqual(status, 200)
+        self.assertEqual(token_queries, [])
+
+    def test_logout_revokes_cached_token(self):
+        self.assertEqual(self.get_me()[0], 200)
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_me()[0], 401)
+
+    def test_deactivation_revokes_cached_token(self):
+        self.assertEqual(self.get_me()[0], 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_me()[0], 401)
@@ -3,7 +3,8 @@ from rest_framework import routers
 
 from users.views import UserViewSet
 
-from .views import FollowViewSet, IngredientViewSet, RecipeViewSet, TagViewSet
+from .views import (FollowViewSet, IngredientViewSet, MetricsView,
+                    RecipeViewSet, TagViewSet)
 
 router = routers.DefaultRouter()
 app_name = 'api'
@@ -16,6 +17,7 @@ router.register(r'users/subscriptions',
 router.register(r'users', UserViewSet, basename='users')
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
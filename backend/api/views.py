@@ -1,36 +1,52 @@
-from django.db.models import Sum
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (BooleanField, Exists, F, OuterRef, Prefetch,
+                              Subquery, Value)
 from django_filters import rest_framework
-from django.http import HttpResponse
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
 from reportlab.lib.pagesizes import A4
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen.canvas import Canvas
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from recipes.models import (Favorite, Follow, Ingredient, IngredientRecipe,
-                            Recipe, ShoppingCart, Tag)
+from recipes.models import (Favorite, Follow, Ingredient, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
+from users.models import User
 
-from .filters import (AuthorFilter, FavoriteFilter, ShoppingCartFilter,
-                      TagFilter, IngredientSearchFilter)
-from .pagination import LimitPageSizePagination
+from . import cache as recipe_cache
+from . import exports
+from .cookable import recipe_ingredient_index
+from .filters import (AuthorFilter, FavoriteFilter, RecipeSearchFilter,
+                      ShoppingCartFilter, TagFilter, IngredientSearchFilter)
+from .ingredient_index import ingredient_index
+from .metrics import histograms
+from .mixins import ConditionalListMixin
+from .pagination import LimitPageSizePagination, RecipePagination
 from .permissions import IsAdminAuthorOrReadPost, IsAdminOrReadOnly
+from .renderers import (CSVRenderer, FormatParamNegotiation, PDFRenderer,
+                        PlainTextRenderer, ShoppingListJSONRenderer)
+from .replicas import read_from_primary
 from .serializers import (FollowSerializer,
                           IngredientSerializer, RecipeCreateSerializer,
                           RecipeSerializer, TagSerializer, FavoriteSerializer)
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [IsAdminOrReadOnly, ]
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [IsAdminOrReadOnly, ]
@@ -38,13 +54,125 @@ class IngredientViewSet(viewsets.ModelViewSet):
     filter_backends = (IngredientSearchFilter,)
     search_fields = ('^name',)
 
+    def get_filtered_response(self, request, *args, **kwargs):
+        name = request.query_params.get(IngredientSearchFilter.search_param)
+        if not name:
+            return super().get_filtered_response(request, *args, **kwargs)
+        return Response(ingredient_index.search(name))
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = (IsAdminAuthorOrReadPost, )
-    pagination_class = LimitPageSizePagination
+    pagination_class = RecipePagination
     filter_backends = (TagFilter, AuthorFilter,
-                       ShoppingCartFilter, FavoriteFilter)
+                       ShoppingCartFilter, FavoriteFilter, RecipeSearchFilter)
+
+    @staticmethod
+    def get_user_flags(user):
+        if not user.is_authenticated:
+            return dict.fromkeys(
+                ('is_favorited', 'is_in_shopping_cart', 'is_subscribed'),
+                Value(False, output_field=BooleanField())
+            )
+        return {
+            'is_favorited': Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            'is_in_shopping_cart': Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            'is_subscribed': Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author'))),
+        }
+
+    def get_queryset(self):
+        return self.queryset.annotate(
+            **self.get_user_flags(self.request.user)
+        )
+
+    @read_from_primary()
+    def build_representations(self, ids):
+        not_set = Value(False, output_field=BooleanField())
+        authors = User.objects.annotate(is_subscribed=not_set)
+        recipes = Recipe.objects.filter(id__in=ids).prefetch_related(
+            Prefetch('author', queryset=authors),
+            'tags',
+            'ingredient_amount__ingredient',
+        ).annotate(
+            is_favorited=not_set,
+            is_in_shopping_cart=not_set,
+        )
+        # Без запроса в контексте ссылки на фото относительные: запись
+        # общая для всех, а хост у клиентов может быть разным.
+        serializer = RecipeSerializer(recipes, many=True, context={})
+        return {item['id']: item for item in serializer.data}
+
+    def get_absolute_images(self, item):
+        build_uri = self.request.build_absolute_uri
+        images = {'image': item['image'] and build_uri(item['image'])}
+        if item['image_renditions'] is not None:
+            images['image_renditions'] = {
+                rendition: {
+                    image_format: build_uri(url)
+                    for image_format, url in urls.items()
+                }
+                for rendition, urls in item['image_renditions'].items()
+            }
+        return images
+
+    def get_representations(self, recipes):
+        shared = recipe_cache.get_or_build(
+            [recipe.id for recipe in recipes], self.build_representations
+        )
+        data = []
+        for recipe in recipes:
+            if recipe.id not in shared:
+                # Рецепт удалён между выборкой страницы и сборкой записи.
+                continue
+            item = dict(shared[recipe.id], **self.get_absolute_images(
+                shared[recipe.id]
+            ))
+            item['author'] = dict(
+                item['author'], is_subscribed=recipe.is_subscribed
+            )
+            item['favorites_count'] = recipe.favorites_count
+            item['is_favorited'] = recipe.is_favorited
+            item['is_in_shopping_cart'] = recipe.is_in_shopping_cart
+            data.append(item)
+        return data
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(self.get_representations(page))
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        data = self.get_representations([recipe])
+        if not data:
+            raise Http404
+        return Response(data[0])
+
+    @action(detail=False, pagination_class=LimitPageSizePagination)
+    def cookable(self, request):
+        """Рецепты из имеющихся ингредиентов, самые подходящие первыми."""
+        ids = request.query_params.getlist('ingredients')
+        if not all(pk.isdigit() for pk in ids):
+            raise ValidationError(
+                {'ingredients': 'Укажите id ингредиентов.'}
+            )
+        ranked = recipe_ingredient_index.search(
+            [int(pk) for pk in ids], settings.COOKABLE_RECIPES_LIMIT
+        )
+        page = self.paginate_queryset(ranked)
+        recipes = self.get_queryset().in_bulk([pk for pk, _, _ in page])
+        page = [row for row in page if row[0] in recipes]
+        data = self.get_representations([recipes[pk] for pk, _, _ in page])
+        counts = {pk: (matched, missing) for pk, matched, missing in page}
+        for item in data:
+            matched, missing = counts[item['id']]
+            item['matched_ingredients'] = matched
+            item['missing_ingredients'] = missing
+        return self.get_paginated_response(data)
 
     def get_serializer_class(self):
         if self.action in ('retrieve', 'list'):
@@ -62,7 +190,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
             if is_already_added:
                 return Response(status=status.HTTP_400_BAD_REQUEST)
             else:
-                model.objects.create(user=user, recipe=recipe)
+                # Список покупок обновляет сигнал в той же транзакции.
+                with transaction.atomic():
+                    model.objects.create(user=user, recipe=recipe)
                 serializer = serializer(
                     recipe, context={'request': request}
                 )
@@ -76,7 +206,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     user=user,
                     recipe=recipe
                 )
-                follower_favorite.delete()
+                with transaction.atomic():
+                    follower_favorite.delete()
                 return Response(status=status.HTTP_204_NO_CONTENT)
             else:
                 return Response(status=status.HTTP_400_BAD_REQUEST)
@@ -101,14 +232,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
             pk
         )
 
+    export_formats = {
+        'txt': exports.text_lines,
+        'csv': exports.csv_lines,
+        'json': exports.json_lines,
+    }
+
     @staticmethod
     def canvas_method(shopping_list):
         begin_position_x, begin_position_y = 30, 730
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = (
-            'attachment; filename="shopping_cart.pdf"')
-        canvas = Canvas(response, pagesize=A4)
-        pdfmetrics.registerFont(TTFont('FreeSans', 'data/fonts/FreeSans.ttf'))
+        buffer = SpooledTemporaryFile(max_size=settings.PDF_SPOOL_MAX_SIZE)
+        canvas = Canvas(buffer, pagesize=A4)
         canvas.setFont('FreeSans', 25)
         canvas.setTitle('Список покупок')
         canvas.drawString(begin_position_x,
@@ -129,18 +263,42 @@ class RecipeViewSet(viewsets.ModelViewSet):
             begin_position_y -= 30
         canvas.showPage()
         canvas.save()
-        return response
+        buffer.seek(0)
+        return FileResponse(
+            buffer,
+            as_attachment=True,
+            filename='shopping_cart.pdf',
+            content_type='application/pdf'
+        )
 
-    @action(detail=False, permission_classes=[IsAuthenticated])
-    def download_shopping_cart(self, request):
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__cart__user=request.user
+    @staticmethod
+    def get_shopping_list(user):
+        return ShoppingListItem.objects.filter(
+            user=user
         ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).order_by(
-            'ingredient__name'
-        ).annotate(ingredient_total=Sum('amount'))
-        return self.canvas_method(ingredients)
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            ingredient_total=F('amount')
+        ).order_by('ingredient__name')
+
+    @action(detail=False, permission_classes=[IsAuthenticated],
+            renderer_classes=(PDFRenderer, PlainTextRenderer, CSVRenderer,
+                              ShoppingListJSONRenderer),
+            content_negotiation_class=FormatParamNegotiation)
+    def download_shopping_cart(self, request):
+        ingredients = self.get_shopping_list(request.user)
+        export_format = request.accepted_renderer.format
+        if export_format == 'pdf':
+            return self.canvas_method(ingredients)
+        export = self.export_formats[export_format]
+        response = StreamingHttpResponse(
+            export(ingredients.iterator()),
+            content_type=f'{request.accepted_renderer.media_type}; '
+                         f'charset=utf-8'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{export_format}"')
+        return response
 
 
 class FollowViewSet(viewsets.ModelViewSet):
@@ -149,16 +307,49 @@ class FollowViewSet(viewsets.ModelViewSet):
     filter_backends = (rest_framework.DjangoFilterBackend,)
     permission_classes = [IsAuthenticated, ]
 
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
+            return int(recipes_limit)
+        return None
+
+    def get_recipes_preview(self):
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'renditions_image', 'cooking_time',
+            'author'
+        )
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.filter(id__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('id')[:recipes_limit]
+            ))
+        return recipes
+
     def get_queryset(self):
-        user = self.request.user
         return Follow.objects.filter(
-            user=user).select_related('author')
+            user=self.request.user
+        ).select_related('author').prefetch_related(
+            Prefetch('author__recipes', queryset=self.get_recipes_preview(),
+                     to_attr='recipes_preview')
+        ).order_by('id')
 
     def get_serializer_context(self):
-        recipes_limit = self.request.query_params.get('recipes_limit')
         return {
             'request': self.request,
             'format': self.format_kwarg,
             'view': self,
-            'recipes_limit': recipes_limit
+            'recipes_limit': self.get_recipes_limit()
         }
+
+
+class MetricsView(APIView):
+    """Метрики запросов в текстовом формате Prometheus."""
+    permission_classes = (IsAdminUser, )
+
+    def get(self, request):
+        return HttpResponse(
+            histograms.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
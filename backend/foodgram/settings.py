@@ -1,4 +1,5 @@
 import os
+import sys
 from datetime import timedelta
 
 from dotenv import load_dotenv
@@ -13,6 +14,8 @@ SECRET_KEY = os.getenv('SECRET_KEY')
 
 DEBUG = False
 
+TESTING = sys.argv[1:2] == ['test']
+
 ALLOWED_HOSTS = ['*']
 
 
@@ -35,6 +38,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +87,125 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения через запятую: адреса серверов PostgreSQL,
+# для SQLite — пути к файлам баз. В тестах без DB_REPLICAS одна
+# реплика — зеркало основной базы (TEST MIRROR), чтобы проверять роутер.
+location = 'NAME' if 'sqlite' in DATABASES['default']['ENGINE'] else 'HOST'
+replicas = list(filter(None, os.getenv('DB_REPLICAS', '').split(',')))
+if TESTING and not replicas:
+    replicas = [DATABASES['default'][location]]
+DATABASE_REPLICAS = []
+for number, replica in enumerate(replicas, start=1):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        location: replica.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+# Сколько секунд после изменения клиент читает только с основной базы.
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+
+# Кэш должен быть общим для воркеров и атомарным: на add держится
+# блокировка перестройки записей, на incr — журнал индекса составов.
+# По умолчанию — memcached из infra/docker-compose.yml; для разработки
+# в одном процессе и в тестах — LocMemCache. FileBasedCache не годится:
+# add и incr в нём не атомарны, а каждая запись перечитывает каталог.
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND',
+    default=(
+        'django.core.cache.backends.locmem.LocMemCache' if TESTING
+        else 'django.core.cache.backends.memcached.MemcachedCache'
+    )
+)
+
+CACHE_LOCATION = os.getenv('CACHE_LOCATION', default='127.0.0.1:11211')
+
+# Версии записей и справочников — под отдельным префиксом: в memcached
+# мелкие ключи живут в своих slab-классах, и крупные записи рецептов
+# их не вытесняют. При желании версии можно вынести на отдельный сервер.
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+    },
+    'versions': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'CACHE_VERSIONS_LOCATION', default=CACHE_LOCATION
+        ),
+        'KEY_PREFIX': 'versions',
+    },
+}
+
+RECIPE_CACHE_TIMEOUT = 60 * 60
+
+AUTH_TOKEN_CACHE_TIMEOUT = 60
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+RECIPE_SEARCH_CONFIG = 'russian'
+
+RECIPE_SEARCH_LIMIT = 1000
+
+COOKABLE_RECIPES_LIMIT = 1000
+
+PDF_FONT = 'data/fonts/FreeSans.ttf'
+
+PDF_SPOOL_MAX_SIZE = 1024 * 1024
+
+# Наибольшая сторона уменьшенных копий фотографий рецептов.
+RECIPE_IMAGE_RENDITIONS = {'card': 480, 'retina': 960, 'detail': 1280}
+
+RECIPE_IMAGE_FORMATS = ('webp', 'jpeg')
+
+RECIPE_IMAGE_QUALITY = 80
+
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+
+RECIPE_IMAGE_MAX_SIDE = 6000
+
+# Общий каталог метрик для всех воркеров; без него метрики у каждого свои.
+# Каталог — локальный для контейнера: живость воркеров проверяется по pid,
+# а файлы завершившихся складываются в archive.json. Очистка каталога
+# сбрасывает счётчики.
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+
+METRICS_FLUSH_INTERVAL = 1.0
+
+# Детектор N+1 — только при разработке и в тестах, где он падает.
+NPLUSONE_ENABLED = DEBUG or TESTING or (
+    os.getenv('NPLUSONE_ENABLED', 'False') == 'True'
+)
+
+# Сколько одинаковых по форме запросов за запрос считать N+1.
+NPLUSONE_THRESHOLD = int(os.getenv('NPLUSONE_THRESHOLD', 5))
+
+NPLUSONE_RAISE = TESTING or os.getenv('NPLUSONE_RAISE', 'False') == 'True'
+
+if NPLUSONE_ENABLED:
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('api.middleware.MetricsMiddleware') + 1,
+        'api.middleware.NPlusOneMiddleware'
+    )
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
+# 0 — обрабатывать фотографии сразу после коммита, без фоновых потоков.
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -107,7 +231,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': (
         'rest_framework.pagination.PageNumberPagination'
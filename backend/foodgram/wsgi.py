@@ -10,7 +10,18 @@ https://docs.djangoproject.com/en/2.2/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_wsgi_application()
+
+from api.cookable import recipe_ingredient_index  # noqa: E402
+from api.ingredient_index import ingredient_index  # noqa: E402
+
+try:
+    ingredient_index.build()
+    recipe_ingredient_index.build()
+except DatabaseError:
+    # База ещё недоступна: индекс соберётся при первом поиске.
+    pass
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class RecipesConfig(AppConfig):
     name = 'recipes'
+
+    def ready(self):
+        from . import counters, shopping_list
+
+        counters.connect()
+        shopping_list.connect()
@@ -0,0 +1,22 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_recipes = ContextVar('writing_ingredients', default=frozenset())
+
+
+@contextmanager
+def writing_ingredients(recipe_id):
+    """
+    Состав рецепта пишется пачкой: обработчики отдельных строк
+    IngredientRecipe пропускают их, а списки покупок, поиск и индексы
+    пишущий код обновляет сам один раз.
+    """
+    token = _recipes.set(_recipes.get() | {recipe_id})
+    try:
+        yield
+    finally:
+        _recipes.reset(token)
+
+
+def is_writing_ingredients(recipe_id):
+    return recipe_id in _recipes.get()
@@ -0,0 +1,66 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+
+from users.models import User
+
+from . import deletion
+from .models import Favorite, Follow, Recipe, ShoppingCart
+
+# Модель-источник: (модель со счётчиком, внешний ключ, поле счётчика).
+COUNTERS = {
+    Favorite: (Recipe, 'recipe_id', 'favorites_count'),
+    ShoppingCart: (Recipe, 'recipe_id', 'shopping_carts_count'),
+    Follow: (User, 'author_id', 'followers_count'),
+    Recipe: (User, 'author_id', 'recipes_count'),
+}
+
+
+def change_counter(sender, instance, delta):
+    model, key, field = COUNTERS[sender]
+    model.objects.filter(pk=getattr(instance, key)).update(
+        **{field: F(field) + delta}
+    )
+
+
+def counter_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(sender, instance, 1)
+
+
+def counter_deleted(sender, instance, using, **kwargs):
+    # Каскад при удалении рецепта или пользователя: счётчик уйдёт вместе
+    # со строкой, не обновляем его по разу на каждую связанную запись.
+    model, key, _ = COUNTERS[sender]
+    if deletion.is_deleting(model, getattr(instance, key), using):
+        return
+    change_counter(sender, instance, -1)
+
+
+def connect():
+    deletion.track(*{model for model, _, _ in COUNTERS.values()})
+    for sender in COUNTERS:
+        post_save.connect(
+            counter_created, sender=sender,
+            dispatch_uid=f'counter_created_{sender.__name__}'
+        )
+        post_delete.connect(
+            counter_deleted, sender=sender,
+            dispatch_uid=f'counter_deleted_{sender.__name__}'
+        )
+
+
+def recount(model, ids=None):
+    """Пересчитывает счётчики model (для всех строк или только для ids)."""
+    counters = {}
+    for sender, (target, key, field) in COUNTERS.items():
+        if target is not model:
+            continue
+        counted = sender.objects.filter(
+            **{key: OuterRef('pk')}
+        ).order_by().values(key).annotate(total=Count('pk')).values('total')
+        counters[field] = Coalesce(Subquery(counted), Value(0))
+    queryset = model.objects.all()
+    if ids is not None:
+        queryset = queryset.filter(pk__in=ids)
+    return queryset.update(**counters)
@@ -0,0 +1,52 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_delete, pre_delete
+
+_state = threading.local()
+
+
+def _clear():
+    _state.deleting = set()
+
+
+def _is_tracked(using):
+    """Набор принадлежит текущей транзакции: после её конца он сброшен."""
+    connection = transaction.get_connection(using)
+    return any(func is _clear for _, func in connection.run_on_commit)
+
+
+def mark(sender, instance, using, **kwargs):
+    if not transaction.get_connection(using).in_atomic_block:
+        return
+    if not _is_tracked(using):
+        _clear()
+        transaction.on_commit(_clear, using=using)
+    _state.deleting.add((sender, instance.pk))
+
+
+def unmark(sender, instance, using, **kwargs):
+    if _is_tracked(using):
+        _state.deleting.discard((sender, instance.pk))
+
+
+def is_deleting(model, pk, using):
+    """
+    Удаляется ли объект в текущей транзакции вместе со связанными.
+
+    Collector сначала отправляет pre_delete всем объектам, потом удаляет
+    зависимые строки, поэтому их post_delete уже знает об удалении
+    родителя и может не обновлять его.
+    """
+    return _is_tracked(using) and (model, pk) in _state.deleting
+
+
+def track(*models):
+    for model in models:
+        pre_delete.connect(
+            mark, sender=model, dispatch_uid=f'deletion_mark_{model.__name__}'
+        )
+        post_delete.connect(
+            unmark, sender=model,
+            dispatch_uid=f'deletion_unmark_{model.__name__}'
+        )
@@ -0,0 +1,200 @@
+import random
+import time
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from api import cache, search
+from recipes import shopping_list
+from recipes.counters import recount
+from recipes.models import (Favorite, Follow, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingCart, Tag)
+from users.models import User
+
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2DFF', 'breakfast'),
+    ('Обед', '#49B64EFF', 'lunch'),
+    ('Ужин', '#8775D2FF', 'dinner'),
+)
+DISHES = (
+    'Суп', 'Салат', 'Запеканка', 'Пирог', 'Рагу', 'Омлет', 'Паста',
+    'Каша', 'Соус', 'Котлеты', 'Оладьи', 'Смузи',
+)
+
+
+def skewed(population):
+    """Случайный элемент; первые встречаются чаще, как популярные авторы."""
+    return population[int(len(population) * random.random() ** 2)]
+
+
+def sample_skewed(population, size, exclude=None):
+    size = min(size, len(population) - (exclude is not None))
+    chosen = set()
+    while len(chosen) < size:
+        item = skewed(population)
+        if item != exclude:
+            chosen.add(item)
+    return chosen
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, рецептами, '
+        'подписками, избранным и корзинами для нагрузочных замеров.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--follows', type=int, default=10,
+            help='Подписок на пользователя.'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Рецептов в избранном у пользователя.'
+        )
+        parser.add_argument(
+            '--carts', type=int, default=3,
+            help='Рецептов в корзине у пользователя.'
+        )
+        parser.add_argument(
+            '--ingredients', type=int, nargs=2, default=(3, 10),
+            metavar=('MIN', 'MAX'), help='Ингредиентов в рецепте.'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--seed', type=int, default=None,
+            help='Зерно генератора для воспроизводимых данных.'
+        )
+
+    def step(self, name, started):
+        self.stdout.write(f'{name}: {time.perf_counter() - started:.1f} с')
+        return time.perf_counter()
+
+    def insert(self, model, rows, return_ids=False):
+        """bulk_create пачками; по запросу возвращает id новых строк."""
+        last_id = model.objects.aggregate(last=Max('id'))['last'] or 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                model.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch)
+        if not return_ids:
+            return None
+        return list(model.objects.filter(
+            id__gt=last_id
+        ).order_by('id').values_list('id', flat=True))
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError(
+                '--users: нужен хотя бы один пользователь, он же автор '
+                'рецептов.'
+            )
+        random.seed(options['seed'])
+        self.batch_size = options['batch_size']
+        started = total_started = time.perf_counter()
+        if not Ingredient.objects.exists():
+            call_command('load_data', verbosity=0)
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS
+            )
+        ingredients = list(Ingredient.objects.values_list('id', 'name'))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        started = self.step('Справочники', started)
+
+        prefix = uuid.uuid4().hex[:8]
+        password = make_password(None)
+        user_ids = self.insert(User, (
+            User(
+                username=f'{prefix}_{number}',
+                email=f'{prefix}_{number}@example.com',
+                first_name='Пользователь',
+                last_name=str(number),
+                password=password,
+            )
+            for number in range(options['users'])
+        ), return_ids=True)
+        started = self.step(f'Пользователи ({len(user_ids)})', started)
+
+        def recipe(number):
+            dish = random.choice(DISHES)
+            main = random.choice(ingredients)[1]
+            return Recipe(
+                author_id=skewed(user_ids),
+                name=f'{dish} «{main}» №{number}'[:200],
+                text=f'{dish} из {main}. Готовить с любовью.',
+                cooking_time=random.randint(5, 180),
+                image='',
+            )
+
+        recipe_ids = self.insert(
+            Recipe, (recipe(number) for number in range(options['recipes'])),
+            return_ids=True
+        )
+        RecipeTag = Recipe.tags.through
+        self.insert(RecipeTag, (
+            RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in random.sample(
+                tag_ids, random.randint(1, min(3, len(tag_ids)))
+            )
+        ))
+        ingredient_ids = [pk for pk, _ in ingredients]
+        self.insert(IngredientRecipe, (
+            IngredientRecipe(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=random.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in random.sample(
+                ingredient_ids, random.randint(*options['ingredients'])
+            )
+        ))
+        started = self.step(f'Рецепты ({len(recipe_ids)})', started)
+
+        self.insert(Follow, (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in sample_skewed(
+                user_ids, options['follows'], exclude=user_id
+            )
+        ))
+        for model, size in ((Favorite, options['favorites']),
+                            (ShoppingCart, options['carts'])):
+            self.insert(model, (
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in user_ids
+                for recipe_id in sample_skewed(recipe_ids, size)
+            ))
+        shopping_list.rebuild(
+            User.objects.filter(id__range=(user_ids[0], user_ids[-1]))
+        )
+        started = self.step('Подписки, избранное и корзины', started)
+
+        # bulk_create не отправляет сигналы: счётчики, поисковые документы
+        # и кэши приводим в порядок сами.
+        recount(Recipe)
+        recount(User)
+        for start in range(0, len(recipe_ids), self.batch_size):
+            search.update_documents(
+                recipe_ids[start:start + self.batch_size]
+            )
+        for model in (Recipe, IngredientRecipe, Tag, Ingredient):
+            cache.bump_model_version(model)
+        cache.invalidate_all()
+        self.step('Счётчики и поиск', started)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - total_started:.1f} с, '
+            f'префикс пользователей: {prefix}'
+        ))
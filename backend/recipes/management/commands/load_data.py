@@ -1,17 +1,133 @@
+import csv
 import json
+import os
+import time
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
+from api.cache import bump_model_version
 from recipes.models import Ingredient
 
+CHUNK_SIZE = 64 * 1024
+SEPARATORS = ' \t\r\n,'
+
+
+def read_json(file):
+    """Отдаёт элементы JSON-массива по одному, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(CHUNK_SIZE)
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in SEPARATORS:
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise CommandError('Ожидается JSON-массив.')
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item
+        buffer = buffer[position:]
+        if not chunk:
+            raise CommandError('Файл JSON оборван или повреждён.')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if not row:
+            continue
+        if len(row) != 2:
+            raise CommandError(f'Ожидается «название,единица»: {row}')
+        yield {'name': row[0], 'measurement_unit': row[1]}
+
 
 class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты из JSON или CSV. Уже существующие пары '
+        '(название, единица измерения) пропускаются, поэтому команду '
+        'можно запускать повторно.'
+    )
+    readers = {'.json': read_json, '.csv': read_csv}
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='data/ingredients.json',
+            help='Файл .json или .csv с ингредиентами.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк обрабатывать одним запросом.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать новые ингредиенты, ничего не записывая.'
+        )
+
+    def load_batch(self, batch, dry_run):
+        existing = set(Ingredient.objects.filter(
+            name__in={name for name, _ in batch}
+        ).values_list('name', 'measurement_unit'))
+        new = [
+            key for key in dict.fromkeys(batch)
+            if key not in existing and key not in self.planned
+        ]
+        self.planned.update(new)
+        if new and not dry_run:
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in new),
+                ignore_conflicts=True
+            )
+        return len(new)
+
     def handle(self, *args, **options):
-        with open('./data/ingredients.json', 'rb') as f:
-            data = json.load(f)
-            for i in data:
-                ingredient = Ingredient()
-                ingredient.name = i['name']
-                ingredient.measurement_unit = i['measurement_unit']
-                ingredient.save()
-                print(i['name'], i['measurement_unit'])
+        path = options['path']
+        reader = self.readers.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .json и .csv.')
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        self.planned = set()
+        total = created = 0
+        batch = []
+        started = time.perf_counter()
+        with open(path, encoding='utf-8', newline='') as file:
+            for item in reader(file):
+                try:
+                    batch.append((
+                        item['name'].strip(),
+                        item['measurement_unit'].strip()
+                    ))
+                except (AttributeError, KeyError, TypeError):
+                    raise CommandError(f'Некорректная запись: {item}')
+                if len(batch) == batch_size:
+                    created += self.load_batch(batch, dry_run)
+                    total += len(batch)
+                    batch = []
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'Обработано строк: {total}')
+            if batch:
+                created += self.load_batch(batch, dry_run)
+                total += len(batch)
+        if created and not dry_run:
+            # bulk_create не отправляет сигналы, справочник сбрасываем сами.
+            bump_model_version(Ingredient)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Проверено" if dry_run else "Загружено"} строк: {total} '
+            f'за {elapsed:.2f} с ({total / max(elapsed, 1e-6):.0f} строк/с); '
+            f'{"будет добавлено" if dry_run else "добавлено"}: {created}, '
+            f'пропущено: {total - created}.'
+        ))
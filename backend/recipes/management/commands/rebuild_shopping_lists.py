@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingListItem
+from recipes.shopping_list import rebuild
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает списки покупок по корзинам после записей в обход '
+        'сигналов (SQL, bulk_create, загрузка дампа).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id пользователя; по умолчанию — все.'
+        )
+
+    def handle(self, *args, **options):
+        users = None
+        if options['users']:
+            users = User.objects.filter(pk__in=options['users'])
+        rebuild(users)
+        self.stdout.write(
+            f'{ShoppingListItem._meta.verbose_name_plural}: '
+            f'{ShoppingListItem.objects.count()}'
+        )
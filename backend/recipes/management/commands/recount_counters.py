@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import recount
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики рецептов, избранного, корзин и подписчиков '
+        'после массовых операций.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк обновлять одним запросом.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model in (Recipe, User):
+            ids = model.objects.order_by('pk').values_list('pk', flat=True)
+            updated = 0
+            batch = []
+            for pk in ids.iterator():
+                batch.append(pk)
+                if len(batch) == batch_size:
+                    updated += recount(model, batch)
+                    batch = []
+            if batch:
+                updated += recount(model, batch)
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: {updated}'
+            )
@@ -0,0 +1,49 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:02
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('Favorite', 'Recipe', 'recipe', 'favorites_count'),
+    ('ShoppingCart', 'Recipe', 'recipe', 'shopping_carts_count'),
+    ('Follow', 'User', 'author', 'followers_count'),
+    ('Recipe', 'User', 'author', 'recipes_count'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for source, target, key, field in COUNTERS:
+        source = apps.get_model('recipes', source)
+        target = apps.get_model(
+            'users' if target == 'User' else 'recipes', target
+        )
+        counted = source.objects.filter(
+            **{key: models.OuterRef('pk')}
+        ).order_by().values(key).annotate(
+            total=models.Count('pk')
+        ).values('total')
+        target.objects.update(**{
+            field: Coalesce(models.Subquery(counted), models.Value(0))
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_shoppinglistitem'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_carts_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:03
+
+from django.db import migrations, models
+
+INGREDIENT_NAME_INDEX = 'recipes_ingredient_upper_name_like'
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    duplicates = IngredientRecipe.objects.values(
+        'recipe_id', 'ingredient_id'
+    ).order_by().annotate(
+        count=models.Count('id'),
+        first_id=models.Min('id'),
+        total=models.Sum('amount')
+    ).filter(count__gt=1)
+    for row in duplicates:
+        rows = IngredientRecipe.objects.filter(
+            recipe_id=row['recipe_id'], ingredient_id=row['ingredient_id']
+        )
+        rows.exclude(id=row['first_id']).delete()
+        rows.update(amount=row['total'])
+
+
+def create_ingredient_name_index(apps, schema_editor):
+    # istartswith на PostgreSQL превращается в UPPER(name) LIKE 'X%'.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INGREDIENT_NAME_INDEX} '
+        'ON recipes_ingredient (UPPER(name::text) text_pattern_ops)'
+    )
+
+
+def drop_ingredient_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INGREDIENT_NAME_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'),
+        ),
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_ingredient_recipe'),
+        ),
+        migrations.RunPython(
+            create_ingredient_name_index, drop_ingredient_name_index
+        ),
+    ]
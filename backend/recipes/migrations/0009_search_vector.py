@@ -0,0 +1,49 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:05
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_INDEX = 'recipes_recipe_search_gin'
+
+
+def fill_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("""
+        UPDATE recipes_recipe AS recipe SET search_vector =
+            setweight(to_tsvector('russian', recipe.name), 'A')
+            || setweight(to_tsvector('russian', recipe.text), 'B')
+            || setweight(to_tsvector('russian', coalesce((
+                SELECT string_agg(ingredient.name, ' ')
+                FROM recipes_ingredientrecipe AS amount
+                JOIN recipes_ingredient AS ingredient
+                    ON ingredient.id = amount.ingredient_id
+                WHERE amount.recipe_id = recipe.id
+            ), '')), 'C')
+    """)
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {SEARCH_INDEX} '
+        'ON recipes_recipe USING gin (search_vector)'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {SEARCH_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_search_vector, drop_search_index),
+    ]
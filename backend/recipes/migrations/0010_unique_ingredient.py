@@ -0,0 +1,54 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:08
+
+from django.db import migrations, models
+
+
+def move_amounts(model, owner, source_id, target_id):
+    """Переносит строки ингредиента source_id на target_id, складывая."""
+    for row in model.objects.filter(ingredient_id=source_id):
+        target = model.objects.filter(
+            ingredient_id=target_id, **{owner: getattr(row, owner)}
+        ).first()
+        if target is None:
+            row.ingredient_id = target_id
+            row.save(update_fields=('ingredient',))
+        else:
+            target.amount += row.amount
+            target.save(update_fields=('amount',))
+            row.delete()
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).order_by().annotate(
+        count=models.Count('id'), first_id=models.Min('id')
+    ).filter(count__gt=1)
+    for group in duplicates:
+        extra = Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(id=group['first_id'])
+        for pk in extra.values_list('id', flat=True):
+            move_amounts(IngredientRecipe, 'recipe_id', pk, group['first_id'])
+            move_amounts(ShoppingListItem, 'user_id', pk, group['first_id'])
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
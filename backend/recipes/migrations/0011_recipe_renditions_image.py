@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_unique_ingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='renditions_image',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+    ]
@@ -0,0 +1,187 @@
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+
+from users.models import User
+
+from . import deletion
+from .batch import is_writing_ingredients
+from .models import (Ingredient, IngredientRecipe, Recipe, ShoppingCart,
+                     ShoppingListItem)
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def apply_deltas(user_ids, deltas):
+    """
+    Меняет суммарные количества ингредиентов в списках покупок.
+
+    deltas — {ingredient_id: изменение количества}. Строки с нулевым
+    или отрицательным итогом удаляются.
+    """
+    user_ids = list(user_ids)
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not user_ids or not deltas:
+        return
+    with transaction.atomic():
+        ShoppingListItem.objects.bulk_create(
+            (
+                ShoppingListItem(user_id=user_id, ingredient_id=pk)
+                for user_id in user_ids
+                for pk, delta in deltas.items() if delta > 0
+            ),
+            ignore_conflicts=True
+        )
+        items = ShoppingListItem.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=deltas
+        )
+        items.update(amount=F('amount') + Case(
+            *(When(ingredient_id=pk, then=Value(delta))
+              for pk, delta in deltas.items()),
+            output_field=IntegerField()
+        ))
+        items.filter(amount__lte=0).delete()
+
+
+def get_recipe_amounts(recipe):
+    return dict(IngredientRecipe.objects.filter(
+        recipe=recipe
+    ).values_list('ingredient_id', 'amount'))
+
+
+def add_recipe(user_id, recipe_id):
+    apply_deltas([user_id], get_recipe_amounts(recipe_id))
+
+
+def remove_recipe(user_id, recipe_id):
+    apply_deltas([user_id], {
+        pk: -amount for pk, amount in get_recipe_amounts(recipe_id).items()
+    })
+
+
+def change_recipe(recipe, deltas):
+    """Переносит изменения ингредиентов рецепта в списки покупок."""
+    apply_deltas(
+        ShoppingCart.objects.filter(
+            recipe=recipe
+        ).values_list('user_id', flat=True),
+        deltas
+    )
+
+
+def rebuild(users=None):
+    """
+    Пересчитывает списки покупок с нуля, как миграция 0006: для всех или
+    для пользователей из queryset users.
+    """
+    items = ShoppingListItem.objects.all()
+    # Одно условие на корзину: второй filter() добавил бы второй JOIN.
+    carts = {'recipe__cart__isnull': False}
+    if users is not None:
+        items = items.filter(user__in=users)
+        carts = {'recipe__cart__user__in': users}
+    totals = IngredientRecipe.objects.filter(**carts).values(
+        'recipe__cart__user_id', 'ingredient_id'
+    ).order_by().annotate(total=Sum('amount'))
+    rows = (
+        ShoppingListItem(
+            user_id=row['recipe__cart__user_id'],
+            ingredient_id=row['ingredient_id'],
+            amount=row['total']
+        )
+        for row in totals.iterator()
+    )
+    with transaction.atomic():
+        items.delete()
+        # bulk_create сам разбивает пачку по лимитам базы, но список
+        # строит целиком, поэтому строки подаются частями.
+        while True:
+            batch = list(islice(rows, REBUILD_BATCH_SIZE))
+            if not batch:
+                break
+            ShoppingListItem.objects.bulk_create(batch)
+
+
+def cart_created(sender, instance, created, **kwargs):
+    if created:
+        add_recipe(instance.user_id, instance.recipe_id)
+
+
+def cart_deleted(sender, instance, using, **kwargs):
+    # Рецепт уже вычтен в recipe_deleted, а список удаляемого
+    # пользователя уйдёт вместе с ним.
+    if (deletion.is_deleting(Recipe, instance.recipe_id, using)
+            or deletion.is_deleting(User, instance.user_id, using)):
+        return
+    remove_recipe(instance.user_id, instance.recipe_id)
+
+
+def recipe_deleted(sender, instance, **kwargs):
+    """pre_delete: пока состав рецепта на месте, вычитает его из списков."""
+    change_recipe(instance, {
+        pk: -amount for pk, amount in get_recipe_amounts(instance).items()
+    })
+
+
+def ingredient_saving(sender, instance, raw, **kwargs):
+    """pre_save: запоминает прежнюю строку состава, изменяемую вне API."""
+    if raw or instance.pk is None:
+        return
+    if is_writing_ingredients(instance.recipe_id):
+        return
+    instance._shopping_list_old = IngredientRecipe.objects.filter(
+        pk=instance.pk
+    ).values_list('recipe_id', 'ingredient_id', 'amount').first()
+
+
+def ingredient_saved(sender, instance, raw, **kwargs):
+    if raw or is_writing_ingredients(instance.recipe_id):
+        return
+    deltas = {(instance.recipe_id, instance.ingredient_id): instance.amount}
+    old = instance.__dict__.pop('_shopping_list_old', None)
+    if old is not None:
+        recipe_id, ingredient_id, amount = old
+        key = (recipe_id, ingredient_id)
+        deltas[key] = deltas.get(key, 0) - amount
+    for recipe_id in {recipe_id for recipe_id, _ in deltas}:
+        change_recipe(recipe_id, {
+            pk: delta for (other, pk), delta in deltas.items()
+            if other == recipe_id
+        })
+
+
+def ingredient_deleted(sender, instance, using, **kwargs):
+    # Удаляемый рецепт уже вычтен в recipe_deleted, а строки удаляемого
+    # ингредиента уйдут из списков вместе с ним.
+    if (is_writing_ingredients(instance.recipe_id)
+            or deletion.is_deleting(Recipe, instance.recipe_id, using)
+            or deletion.is_deleting(Ingredient, instance.ingredient_id,
+                                    using)):
+        return
+    change_recipe(
+        instance.recipe_id, {instance.ingredient_id: -instance.amount}
+    )
+
+
+def connect():
+    """
+    Списки покупок следуют за корзиной и составом рецептов при любой
+    записи: через API, в админке и при каскадном удалении рецепта или
+    пользователя.
+    """
+    deletion.track(Recipe, User, Ingredient)
+    post_save.connect(cart_created, sender=ShoppingCart,
+                      dispatch_uid='shopping_list_cart_created')
+    post_delete.connect(cart_deleted, sender=ShoppingCart,
+                        dispatch_uid='shopping_list_cart_deleted')
+    pre_delete.connect(recipe_deleted, sender=Recipe,
+                       dispatch_uid='shopping_list_recipe_deleted')
+    pre_save.connect(ingredient_saving, sender=IngredientRecipe,
+                     dispatch_uid='shopping_list_ingredient_saving')
+    post_save.connect(ingredient_saved, sender=IngredientRecipe,
+                      dispatch_uid='shopping_list_ingredient_saved')
+    post_delete.connect(ingredient_deleted, sender=IngredientRecipe,
+                        dispatch_uid='shopping_list_ingredient_deleted')
@@ -37,6 +37,16 @@ class User(AbstractUser):
         choices=CHOICES,
         default=USER,
     )
+    recipes_count = models.IntegerField(
+        verbose_name='рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.IntegerField(
+        verbose_name='подписчиков',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         constraints = [
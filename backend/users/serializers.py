@@ -1,3 +1,4 @@
+from django.db.models import Manager
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
@@ -5,6 +6,28 @@ from users.models import User
 from recipes.models import Follow
 
 
+class UserListSerializer(serializers.ListSerializer):
+    """Загружает подписки на всех выводимых авторов одним запросом."""
+
+    def to_representation(self, data):
+        if isinstance(data, Manager):
+            data = data.all()
+        users = list(data)
+        request = self.context.get('request')
+        if request is not None and request.user.is_authenticated:
+            subscriptions = self.context.setdefault('subscriptions', {})
+            ids = {user.id for user in users} - subscriptions.keys()
+            if ids:
+                subscriptions.update(dict.fromkeys(ids, False))
+                subscriptions.update(dict.fromkeys(
+                    Follow.objects.filter(
+                        user=request.user, author__in=ids
+                    ).values_list('author_id', flat=True),
+                    True
+                ))
+        return super().to_representation(users)
+
+
 class UserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField(
         method_name='get_is_subscribed'
@@ -22,6 +45,7 @@ class UserSerializer(serializers.ModelSerializer):
             'is_subscribed'
         )
         extra_kwargs = {'password': {'write_only': True}}
+        list_serializer_class = UserListSerializer
 
     def create(self, validated_data):
         user = User.objects.create(
@@ -36,6 +60,11 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        subscriptions = self.context.get('subscriptions', {})
+        if obj.id in subscriptions:
+            return subscriptions[obj.id]
         user = self.context.get('request').user
         if user.is_authenticated:
             return Follow.objects.filter(
@@ -48,6 +48,7 @@ class UserViewSet(viewsets.ModelViewSet):
                     user=user,
                     author=author
                 )
+                author.refresh_from_db(fields=('followers_count',))
                 recipes_limit = self.request.query_params.get('recipes_limit')
                 serializer = FollowSerializer(
                     new_following,